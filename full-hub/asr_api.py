@@ -1,5 +1,6 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from funasr import AutoModel
 import torch
 import json
@@ -7,11 +8,20 @@ import numpy as np
 import os
 import sys
 import re
+import time
+import asyncio
+import threading
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from queue import Queue
 from modelscope.hub.snapshot_download import snapshot_download
 
+from idle_manager import IdleModelManager
+from inference_queue import InferenceQueue, QueueFullError
+
 # 保存原始的stdout和stderr
 original_stdout = sys.stdout
 original_stderr = sys.stderr
@@ -80,7 +90,7 @@ VAD_THRESHOLD = 0.5
 vad_state = {
     "is_running": False,
     "active_websockets": set(),
-    "model": None,
+    "pool": None,
     "result_queue": Queue()
 }
 
@@ -90,10 +100,131 @@ torch.set_default_dtype(torch.float32)
 
 # 初始化模型状态
 model_state = {
-    "vad_model": None,
     "asr_model": None,
-    "punc_model": None
+    "punc_model": None,
+    "streaming_asr_model": None
+}
+
+# ASR和标点模型空闲多少秒后卸载，下次请求时重新加载，0表示常驻；VAD模型很小，始终常驻
+IDLE_UNLOAD_SECONDS = float(os.environ.get("ASR_IDLE_UNLOAD_SECONDS", "1800"))
+
+# 上传识别的并发数和最多排队数：排满后新请求直接返回 503，排队时间见 /ready 的 asr_queue
+ASR_CONCURRENCY = int(os.environ.get("ASR_CONCURRENCY", "1"))
+ASR_MAX_PENDING = int(os.environ.get("ASR_MAX_PENDING", "16"))
+asr_queue = InferenceQueue(ASR_CONCURRENCY, ASR_MAX_PENDING, name="asr")
+# 跨请求批量识别：同一时长档位里排队的音频最多 ASR_MAX_BATCH_SIZE 条合成一次 generate
+ASR_MAX_BATCH_SIZE = int(os.environ.get("ASR_MAX_BATCH_SIZE", "8"))
+
+# 流式识别（paraformer-zh-streaming）：chunk_size [0, 10, 5] 表示每 600ms 出一次结果、向后看 300ms
+STREAMING_CHUNK_SIZE = [0, 10, 5]
+STREAMING_ENCODER_LOOK_BACK = 4
+STREAMING_DECODER_LOOK_BACK = 1
+STREAMING_CHUNK_STRIDE = STREAMING_CHUNK_SIZE[1] * 960  # 每次送给模型的采样点数
+# FunASR 的 AutoModel 在 generate 时把本次的 cache 写进模型共享的 kwargs，多个连接同时解码会串用
+# 彼此的编码器/解码器状态，所以流式解码要串行
+streaming_decode_lock = threading.Lock()
+# 静音超过多少毫秒算一句话结束；语音开始前补多少毫秒音频，避免吞掉第一个字
+SPEECH_END_MS = int(os.environ.get("ASR_SPEECH_END_MS", "500"))
+SPEECH_PAD_MS = int(os.environ.get("ASR_SPEECH_PAD_MS", "200"))
+SPEECH_END_SAMPLES = SPEECH_END_MS * SAMPLE_RATE // 1000
+# 结束阈值比开始阈值低一些，防止句中停顿附近概率抖动导致反复断句
+VAD_END_THRESHOLD = VAD_THRESHOLD - 0.15
+# /v1/ws/vad 支持的回复格式
+VAD_REPLY_MODES = ("json", "binary", "events")
+# VAD 会话池：每个连接独占一个 Silero 会话，预先加载 VAD_POOL_SIZE 个，不够时再加；
+# 推理放到大小为 VAD_THREADS 的线程池里，多个客户端可以并行，也不阻塞事件循环
+VAD_POOL_SIZE = int(os.environ.get("ASR_VAD_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+VAD_THREADS = int(os.environ.get("ASR_VAD_THREADS", str(os.cpu_count() or 1)))
+vad_executor = ThreadPoolExecutor(max_workers=VAD_THREADS, thread_name_prefix="vad")
+VAD_LOCAL_PATH = os.path.join(MODEL_DIR, "torch_hub", "snakers4_silero-vad_master")
+
+# 就绪状态：模型加载并预热完成后才算就绪
+readiness = {
+    "ready": False,
+    "load_time": None,
+    "warmup_time": None,
+    "error": None
 }
+loading_task = None  # 后台加载任务，保留引用防止被回收
+
+
+class VadPool:
+    """Silero VAD 会话池
+
+    Silero 模型在调用之间保存 RNN 状态，多个连接共用一个实例会把各自的音频混进同一份状态。
+    所以每个连接 acquire() 独占一个会话，断开时 release() 重置状态后放回池里；
+    池里没有空闲会话时现场再加载一个，VAD 模型很小，加载很快。
+    空闲会话最多保留 size 个，连接高峰时多加载的会话在归还时丢弃。
+    """
+
+    def __init__(self, load_fn, size):
+        self.load_fn = load_fn
+        self.size = size
+        self._idle = [load_fn() for _ in range(size)]
+        self._lock = threading.Lock()
+        self.created = size
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            self.in_use += 1
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        print(f"VAD会话池已用完，新加载一个会话（共 {self.created} 个）")
+        try:
+            return self.load_fn()
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+                self.created -= 1
+            raise
+
+    def release(self, model):
+        if hasattr(model, "reset_states"):
+            model.reset_states()
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) >= self.size:
+                self.created -= 1
+                return
+            self._idle.append(model)
+
+    def idle_sessions(self):
+        with self._lock:
+            return list(self._idle)
+
+    def stats(self):
+        return {
+            "size": self.created,
+            "target_size": self.size,
+            "in_use": self.in_use,
+            "threads": VAD_THREADS
+        }
+
+
+def load_vad_model(local_vad_path):
+    """从本地加载一个 Silero VAD（ONNX）会话"""
+    # 关键：通过`source='local'`强制使用本地模式，避免torch.hub解析repo_or_dir为远程仓库
+    vad_model_tuple = torch.hub.load(
+        repo_or_dir=local_vad_path,
+        model='silero_vad',
+        force_reload=False,
+        onnx=True,
+        trust_repo=True,
+        source='local'  # 添加这一行，强制本地加载模式
+    )
+    # 解包模型（silero-vad的torch.hub.load返回元组 (model, example)）
+    return vad_model_tuple[0]
+
+
+def load_vad_pool():
+    """加载 VAD 会话池，由空闲管理器记录加载耗时"""
+    return VadPool(lambda: load_vad_model(VAD_LOCAL_PATH), VAD_POOL_SIZE)
+
+
+# VAD 模型很小又一直在用，常驻不卸载
+vad_manager = IdleModelManager("VAD", load_vad_pool, pinned=True)
 
 
 def download_vad_models():
@@ -111,14 +242,26 @@ def download_vad_models():
 # 使用 FastAPI 的生命周期事件装饰器
 @app.on_event("startup")
 async def startup_event():
-    print("正在加载模型...")
+    global loading_task
+    # 模型加载和预热放到后台，端口先打开；加载完成前 /ready 返回 503，识别接口也不接收请求
+    loading_task = asyncio.get_running_loop().create_task(load_service())
+
+
+async def load_service():
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_models)
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"模型加载失败: {str(e)}")
+
 
-    # 检查VAD模型目录是否存在
-    torch_hub_dir = os.path.join(MODEL_DIR, "torch_hub")
-    local_vad_path = os.path.join(torch_hub_dir, "snakers4_silero-vad_master")
+def load_models():
+    """下载并加载 VAD、ASR、标点模型，然后预热，在线程里运行"""
+    print("正在加载模型...")
+    start_time = time.time()
 
     # 如果VAD模型目录不存在，则下载
-    if not os.path.exists(local_vad_path):
+    if not os.path.exists(VAD_LOCAL_PATH):
         print("未找到VAD模型目录，开始下载...")
         download_vad_models()
     else:
@@ -126,25 +269,21 @@ async def startup_event():
 
     # 加载VAD模型（严格本地模式，避免torch.hub解析路径）
     try:
-        print("正在从本地加载VAD模型...")
-        # 关键：通过`source='local'`强制使用本地模式，避免torch.hub解析repo_or_dir为远程仓库
-        model_state["vad_model"] = torch.hub.load(
-            repo_or_dir=local_vad_path,
-            model='silero_vad',
-            force_reload=False,
-            onnx=True,
-            trust_repo=True,
-            source='local'  # 添加这一行，强制本地加载模式
-        )
-
-        # 解包模型（silero-vad的torch.hub.load返回元组 (model, example)）
-        vad_model_tuple = model_state["vad_model"]
-        model_state["vad_model"] = vad_model_tuple[0]  # 提取第一个元素（模型本体）
-        print("VAD模型加载完成")
+        vad_state["pool"] = vad_manager.load()
     except Exception as e:
         print(f"VAD模型加载失败: {str(e)}")
         raise e
 
+    asr_manager.load()
+    readiness["load_time"] = time.time() - start_time
+
+    warmup_models()
+    readiness["ready"] = True
+
+
+@contextmanager
+def funasr_model_env():
+    """临时设置环境变量，让 FunASR 模型下载到 asr-hub 下"""
     # 设置环境变量来指定模型下载位置
     asr_model_path = os.path.join(MODEL_DIR, "asr")
     if not os.path.exists(asr_model_path):
@@ -157,7 +296,29 @@ async def startup_event():
     # 设置环境变量
     os.environ['MODELSCOPE_CACHE'] = asr_model_path
     os.environ['FUNASR_HOME'] = MODEL_DIR
+    try:
+        yield
+    finally:
+        # 恢复原始环境变量
+        if original_modelscope_cache:
+            os.environ['MODELSCOPE_CACHE'] = original_modelscope_cache
+        else:
+            os.environ.pop('MODELSCOPE_CACHE', None)
+
+        if original_funasr_home:
+            os.environ['FUNASR_HOME'] = original_funasr_home
+        else:
+            os.environ.pop('FUNASR_HOME', None)
+
 
+def load_asr_models():
+    """加载ASR和标点模型，供空闲管理器在启动和空闲卸载后调用"""
+    with funasr_model_env():
+        load_asr_and_punc()
+    return model_state["asr_model"], model_state["punc_model"]
+
+
+def load_asr_and_punc():
     # 加载ASR模型
     print("正在加载ASR模型...")
     model_state["asr_model"] = AutoModel(
@@ -177,40 +338,295 @@ async def startup_event():
         model_type="pytorch",
         dtype="float32"
     )
+    print("标点符号模型加载完成")
 
-    # 恢复原始环境变量
-    if original_modelscope_cache:
-        os.environ['MODELSCOPE_CACHE'] = original_modelscope_cache
-    else:
-        os.environ.pop('MODELSCOPE_CACHE', None)
 
-    if original_funasr_home:
-        os.environ['FUNASR_HOME'] = original_funasr_home
-    else:
-        os.environ.pop('FUNASR_HOME', None)
-    print("标点符号模型加载完成")
+def release_asr_models(_):
+    model_state["asr_model"] = None
+    model_state["punc_model"] = None
 
-    vad_state["model"] = model_state["vad_model"]
+
+asr_manager = IdleModelManager("ASR", load_asr_models, release_asr_models, IDLE_UNLOAD_SECONDS)
+
+
+def load_streaming_model():
+    """加载流式识别模型，第一个流式连接到来时才加载"""
+    with funasr_model_env():
+        model_state["streaming_asr_model"] = AutoModel(
+            model="paraformer-zh-streaming",
+            model_revision="v2.0.4",
+            device=device,
+            model_type="pytorch",
+            dtype="float32"
+        )
+    return model_state["streaming_asr_model"]
+
+
+def release_streaming_model(_):
+    model_state["streaming_asr_model"] = None
+
+
+streaming_manager = IdleModelManager("流式ASR", load_streaming_model, release_streaming_model, IDLE_UNLOAD_SECONDS)
+
+
+def warmup_models():
+    """用一小段合成音频把 VAD、ASR、标点模型各跑一遍，让第一个真实请求不用承担初始化开销"""
+    print("模型预热中...")
+    start_time = time.time()
+    try:
+        with torch.no_grad():
+            for vad_model in vad_state["pool"].idle_sessions():
+                vad_model(torch.zeros(WINDOW_SIZE), SAMPLE_RATE)
+                # silero-vad 有内部状态，预热后清掉
+                if hasattr(vad_model, "reset_states"):
+                    vad_model.reset_states()
+
+            noise = np.random.default_rng(0).normal(0, 0.01, SAMPLE_RATE).astype(np.float32)
+            with asr_manager.use():
+                model_state["asr_model"].generate(input=noise, dtype="float32")
+                model_state["punc_model"].generate(input="你好今天天气怎么样", dtype="float32")
+    except Exception as e:
+        print(f"模型预热失败: {str(e)}")
+    readiness["warmup_time"] = time.time() - start_time
+    print(f"模型预热完成，耗时 {readiness['warmup_time']:.2f}s")
+
+
+def vad_probabilities(model, windows):
+    """用一个连接独占的 VAD 会话对连续的若干个窗口依次推理（状态在窗口之间延续），返回每个窗口的语音概率"""
+    probabilities = np.empty(len(windows), dtype=np.float32)
+    with torch.no_grad():
+        for i, window in enumerate(windows):
+            probabilities[i] = model(torch.from_numpy(window), SAMPLE_RATE).item()
+    return probabilities
+
+
+class FrameBuffer:
+    """把任意长度的音频切成 VAD 窗口，不足一个窗口的部分留到下一次"""
+
+    def __init__(self):
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.offset = 0  # 已切出的采样点数，即下一个窗口在整条音频流里的起点
+
+    def split(self, audio):
+        audio = np.concatenate([self.pending, audio])
+        usable = len(audio) // WINDOW_SIZE * WINDOW_SIZE
+        self.pending = audio[usable:].copy()
+        self.offset += usable
+        return audio[:usable].reshape(-1, WINDOW_SIZE)
+
+
+class SpeechSegmenter:
+    """根据每个窗口的语音概率判断一句话的开始和结束
+
+    概率超过 VAD_THRESHOLD 算开始；之后低于 VAD_END_THRESHOLD 的静音累计 SPEECH_END_MS 算结束。
+    """
+
+    def __init__(self):
+        self.speaking = False
+        self.silence = 0  # 连续静音的采样点数
+
+    def update(self, probability):
+        """返回 "start"、"end" 或 None"""
+        if not self.speaking:
+            if probability > VAD_THRESHOLD:
+                self.speaking = True
+                self.silence = 0
+                return "start"
+            return None
+
+        self.silence = self.silence + WINDOW_SIZE if probability < VAD_END_THRESHOLD else 0
+        if self.silence >= SPEECH_END_SAMPLES:
+            self.reset()
+            return "end"
+        return None
+
+    def reset(self):
+        self.speaking = False
+        self.silence = 0
+
+
+class StreamingSession:
+    """一条流式识别连接的状态：服务端 VAD 断句，说话期间每攒够一块就增量解码
+
+    feed() 接收任意长度的音频，返回要推给客户端的事件列表：
+    speech_start（检测到开始说话）、partial（当前句子已识别的文字）、final（一句话结束，带标点的完整文字）。
+    """
+
+    def __init__(self, vad_model):
+        self.vad_model = vad_model
+        self.frames = FrameBuffer()
+        self.segmenter = SpeechSegmenter()
+        self.pre_roll = deque(maxlen=max(1, SPEECH_PAD_MS * SAMPLE_RATE // 1000 // WINDOW_SIZE))
+        self.speech = np.zeros(0, dtype=np.float32)  # 已检测为语音、还没送去解码的音频
+        self.cache = {}  # 流式模型跨块保存的编码器/解码器状态
+        self.text = ""
+
+    def feed(self, audio):
+        events = []
+        windows = self.frames.split(audio)
+        if not len(windows):
+            return events
+
+        for window, probability in zip(windows, vad_probabilities(self.vad_model, windows)):
+            was_speaking = self.segmenter.speaking
+            change = self.segmenter.update(probability)
+
+            if not was_speaking:
+                self.pre_roll.append(window)
+                if change == "start":
+                    self.speech = np.concatenate(list(self.pre_roll))
+                    self.pre_roll.clear()
+                    events.append({"type": "speech_start"})
+                continue
+
+            self.speech = np.concatenate([self.speech, window])
+            if change == "end":
+                events.extend(self.finalize())
+                continue
+
+            while len(self.speech) >= STREAMING_CHUNK_STRIDE:
+                chunk = self.speech[:STREAMING_CHUNK_STRIDE]
+                self.speech = self.speech[STREAMING_CHUNK_STRIDE:]
+                if self.decode(chunk, is_final=False):
+                    events.append({"type": "partial", "text": self.text})
+        return events
+
+    def decode(self, chunk, is_final):
+        """送一块音频给流式模型，返回这一块是否识别出了新文字"""
+        with streaming_decode_lock, torch.no_grad():
+            result = model_state["streaming_asr_model"].generate(
+                input=chunk,
+                cache=self.cache,
+                is_final=is_final,
+                chunk_size=STREAMING_CHUNK_SIZE,
+                encoder_chunk_look_back=STREAMING_ENCODER_LOOK_BACK,
+                decoder_chunk_look_back=STREAMING_DECODER_LOOK_BACK
+            )
+        piece = result[0]["text"] if result else ""
+        self.text += piece
+        return bool(piece)
+
+    def finish(self):
+        """强制结束当前句子（客户端发送 "end"）"""
+        if not self.segmenter.speaking:
+            return []
+        self.segmenter.reset()
+        return self.finalize()
+
+    def finalize(self):
+        """结束当前句子：解码剩余音频、加标点，并重置状态等待下一句"""
+        # 剩余音频为空时补一小段静音，让模型把缓存里的内容输出
+        remainder = self.speech if len(self.speech) else np.zeros(WINDOW_SIZE, dtype=np.float32)
+        self.decode(remainder, is_final=True)
+
+        text = self.text
+        if text:
+            with asr_manager.use(), torch.no_grad():
+                punctuated = model_state["punc_model"].generate(input=text, dtype="float32")
+            if punctuated:
+                text = punctuated[0]["text"]
+
+        self.speech = np.zeros(0, dtype=np.float32)
+        self.cache = {}
+        self.text = ""
+        return [{"type": "final", "text": text}]
+
+
+@app.websocket("/v1/ws/asr")
+async def streaming_asr_endpoint(websocket: WebSocket):
+    """流式识别：客户端持续发送 16kHz float32 音频（长度任意），发送文本 "end" 可强制结束当前句子
+
+    服务端推送 JSON 事件 speech_start / partial / final，不需要再上传整段音频。
+    """
+    if not readiness["ready"]:
+        await websocket.close(code=1013)  # 模型加载中，稍后重试
+        return
+    await websocket.accept()
+    print("新的流式识别连接")
+    loop = asyncio.get_running_loop()
+    vad_model = None
+    try:
+        vad_model = await loop.run_in_executor(vad_executor, vad_state["pool"].acquire)
+        session = StreamingSession(vad_model)
+        # 连接期间一直占用流式模型，避免说到一半被空闲卸载
+        async with streaming_manager.use_async():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    audio = np.frombuffer(message["bytes"], dtype=np.float32)
+                    events = await loop.run_in_executor(None, session.feed, audio)
+                elif message.get("text") == "end":
+                    events = await loop.run_in_executor(None, session.finish)
+                else:
+                    continue
+                for event in events:
+                    await websocket.send_text(json.dumps(event, ensure_ascii=False))
+    except WebSocketDisconnect:
+        print("流式识别客户端断开连接")
+    except Exception as e:
+        print(f"流式识别出错: {str(e)}")
+    finally:
+        if vad_model is not None:
+            vad_state["pool"].release(vad_model)
+        print("流式识别连接关闭")
+        try:
+            await websocket.close()
+        except:
+            pass
 
 
 @app.websocket("/v1/ws/vad")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, mode: str = "json"):
+    """VAD：客户端发送 16kHz float32 音频，长度任意，不足一个窗口的部分留到下一条消息
+
+    mode 决定回复格式（通过 ?mode= 指定）：
+    json   - 每条消息回复一次 {"is_speech", "probability"}（最后一个窗口的结果），多个窗口时附带 probabilities
+    binary - 每条消息回复一个字节数组，每个窗口一个字节，语音概率量化到 0-255
+    events - 只在一句话开始和结束时回复 {"type": "speech_start"/"speech_end", "offset_ms"}
+    """
+    if mode not in VAD_REPLY_MODES:
+        await websocket.close(code=1008)
+        return
+    if not readiness["ready"]:
+        await websocket.close(code=1013)  # 模型加载中，稍后重试
+        return
     await websocket.accept()
     vad_state["active_websockets"].add(websocket)
+    loop = asyncio.get_running_loop()
+    vad_model = None
+    frames = FrameBuffer()
+    segmenter = SpeechSegmenter()
     try:
+        vad_model = await loop.run_in_executor(vad_executor, vad_state["pool"].acquire)
         print("新的WebSocket连接")
         while True:
             try:
                 data = await websocket.receive_bytes()
-                audio = np.frombuffer(data, dtype=np.float32).copy()
-
-                if len(audio) == WINDOW_SIZE:
-                    audio_tensor = torch.FloatTensor(audio)
-                    speech_prob = vad_state["model"](audio_tensor, SAMPLE_RATE).item()
+                windows = frames.split(np.frombuffer(data, dtype=np.float32))
+                if not len(windows):
+                    continue
+
+                # 一条消息里的所有窗口连续推理，模型状态在窗口之间延续
+                probabilities = await loop.run_in_executor(vad_executor, vad_probabilities, vad_model, windows)
+                if mode == "binary":
+                    await websocket.send_bytes(np.round(probabilities * 255).astype(np.uint8).tobytes())
+                elif mode == "events":
+                    first_window = frames.offset - len(windows) * WINDOW_SIZE
+                    for i, probability in enumerate(probabilities):
+                        change = segmenter.update(probability)
+                        if change:
+                            offset_ms = (first_window + i * WINDOW_SIZE) * 1000 // SAMPLE_RATE
+                            await websocket.send_text(json.dumps({"type": f"speech_{change}", "offset_ms": offset_ms}))
+                else:
+                    speech_prob = float(probabilities[-1])
                     result = {
                         "is_speech": speech_prob > VAD_THRESHOLD,
-                        "probability": float(speech_prob)
+                        "probability": speech_prob
                     }
+                    if len(probabilities) > 1:
+                        result["probabilities"] = probabilities.tolist()
                     await websocket.send_text(json.dumps(result))
             except WebSocketDisconnect:
                 print("客户端断开连接")
@@ -223,6 +639,9 @@ async def websocket_endpoint(websocket: WebSocket):
     finally:
         if websocket in vad_state["active_websockets"]:
             vad_state["active_websockets"].remove(websocket)
+        # 重置该连接的 VAD 状态并放回池里
+        if vad_model is not None:
+            vad_state["pool"].release(vad_model)
         print("WebSocket连接关闭")
         try:
             await websocket.close()
@@ -230,8 +649,167 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
 
 
+def recognize(audio):
+    """识别一段音频，没有识别结果时返回 None"""
+    asr_result = model_state["asr_model"].generate(
+        input=audio,  # 直接传入音频数组！
+        dtype="float32"
+    )
+    return asr_result[0]["text"] if asr_result else None
+
+
+def punctuate(text):
+    """添加标点符号"""
+    if not text:
+        return text
+    final_result = model_state["punc_model"].generate(
+        input=text,
+        dtype="float32"
+    )
+    return final_result[0]["text"] if final_result else text
+
+
+def transcribe_batch(audios):
+    """一次识别多段音频并分别加标点；模型被空闲卸载时先重新加载
+
+    返回与输入一一对应的结果：文字、None（没有识别结果）或该条出错时的异常。
+    批量识别出错（比如某条是双声道）时退回逐条识别，一条坏音频不会连累同批的其他请求。
+    """
+    with asr_manager.use(), torch.no_grad():
+        texts = None
+        if len(audios) > 1:
+            try:
+                # AutoModel 的 batch_size 默认为1（CPU上初始化时也会强制为1），要在这里指定才会真的合批
+                asr_results = model_state["asr_model"].generate(
+                    input=list(audios),
+                    batch_size=len(audios),
+                    dtype="float32"
+                )
+                if len(asr_results) == len(audios):
+                    texts = [asr_result.get("text") for asr_result in asr_results]
+                else:
+                    print(f"批量识别结果数量 {len(asr_results)} 与输入 {len(audios)} 不一致，逐条重新识别")
+            except Exception as e:
+                print(f"批量识别出错，逐条重新识别: {str(e)}")
+
+        if texts is None:
+            texts = []
+            for audio in audios:
+                try:
+                    texts.append(recognize(audio))
+                except Exception as e:
+                    texts.append(e)
+
+        results = []
+        for text in texts:
+            try:
+                results.append(punctuate(text) if isinstance(text, str) else text)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class AsrBatchScheduler:
+    """上传识别的批处理调度：按时长分档，同档排队的音频合成一批识别
+
+    每条音频都往识别队列里提交一个任务（排队上限、等待时间统计照旧由 asr_queue 负责）。
+    任务开始执行时，把同一档位里还在排队的音频最多 ASR_MAX_BATCH_SIZE 条一起取走识别；
+    后面轮到的任务发现自己的音频已经被别的批次带走，就直接结束。
+    空闲时每条音频单独识别，不额外等待；模型忙的时候排队的音频自然攒成批。
+    按时长分档是为了避免短句和长句一起 padding，白白浪费算力。
+    """
+
+    def __init__(self, max_batch_size, queue):
+        self.max_batch_size = max_batch_size
+        self.queue = queue
+        self._pending = {}  # 时长档位 -> [(音频, Future), ...]
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+
+    @staticmethod
+    def length_bucket(audio):
+        """按时长分档：1秒以内、2秒、4秒、8秒……"""
+        seconds = len(audio) / SAMPLE_RATE
+        return int(np.ceil(np.log2(max(seconds, 1.0))))
+
+    async def transcribe(self, audio):
+        """识别一段音频，返回带标点的文字，没有识别结果时返回 None"""
+        bucket = self.length_bucket(audio)
+        item = (audio, Future())
+        with self._lock:
+            self._pending.setdefault(bucket, []).append(item)
+        try:
+            try:
+                await self.queue.run(self._drain, bucket)
+            except QueueFullError:
+                # 没排上队：还没被别的批次带走就撤掉并返回 503，否则等那一批的结果
+                if self._withdraw(bucket, item):
+                    raise
+            return await asyncio.wrap_future(item[1])
+        finally:
+            # 调用方断开（任务被取消）等情况下，音频还在排队就撤掉，免得之后白白识别
+            self._withdraw(bucket, item)
+
+    def _withdraw(self, bucket, item):
+        """把还没被批次取走的音频撤掉并取消它的 Future，返回是否撤掉了"""
+        with self._lock:
+            waiting = self._pending.get(bucket, [])
+            for i, queued in enumerate(waiting):
+                if queued is item:
+                    del waiting[i]
+                    item[1].cancel()
+                    return True
+        return False
+
+    def _drain(self, bucket):
+        with self._lock:
+            waiting = self._pending.get(bucket, [])
+            batch = waiting[:self.max_batch_size]
+            del waiting[:self.max_batch_size]
+        # 调用方已经断开的就不识别了；标记为运行中之后 Future 不能再被取消
+        batch = [(audio, future) for audio, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            texts = transcribe_batch([audio for audio, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), text in zip(batch, texts):
+            if isinstance(text, Exception):
+                future.set_exception(text)
+            else:
+                future.set_result(text)
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        with self._lock:
+            pending = {str(bucket): len(items) for bucket, items in sorted(self._pending.items()) if items}
+        return {
+            "pending": pending,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0
+        }
+
+
+asr_batcher = AsrBatchScheduler(ASR_MAX_BATCH_SIZE, asr_queue)
+
+
 @app.post("/v1/upload_audio")
 async def upload_audio(file: UploadFile = File(...)):
+    if not readiness["ready"]:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "1"},
+            content={"status": "error", "message": "模型加载中，请稍后重试"}
+        )
     try:
         # 直接读取音频数据到内存
         audio_bytes = await file.read()
@@ -255,33 +833,28 @@ async def upload_audio(file: UploadFile = File(...)):
                     "message": "需要安装 soundfile 或 librosa 库来处理音频"
                 }
 
-        # 进行ASR处理 - 直接传入音频数组
-        with torch.no_grad():
-            # 语音识别 - 传入 numpy 数组而不是文件路径
-            asr_result = model_state["asr_model"].generate(
-                input=audio_data,  # 直接传入音频数组！
-                dtype="float32"
+        # 进行ASR处理 - 放到识别队列的线程里，不阻塞事件循环
+        try:
+            text = await asr_batcher.transcribe(audio_data)
+        except QueueFullError:
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "1"},
+                content={"status": "error", "message": "识别任务过多，请稍后重试"}
             )
 
-            # 添加标点符号
-            if asr_result and len(asr_result) > 0:
-                text_input = asr_result[0]["text"]
-                final_result = model_state["punc_model"].generate(
-                    input=text_input,
-                    dtype="float32"
-                )
+        if text is None:
+            return {
+                "status": "error",
+                "filename": file.filename or "uploaded_audio",
+                "message": "语音识别失败"
+            }
 
-                return {
-                    "status": "success",
-                    "filename": file.filename or "uploaded_audio",
-                    "text": final_result[0]["text"] if final_result else text_input
-                }
-            else:
-                return {
-                    "status": "error",
-                    "filename": file.filename or "uploaded_audio",
-                    "message": "语音识别失败"
-                }
+        return {
+            "status": "success",
+            "filename": file.filename or "uploaded_audio",
+            "text": text
+        }
 
     except Exception as e:
         print(f"处理音频时出错: {str(e)}")
@@ -291,6 +864,14 @@ async def upload_audio(file: UploadFile = File(...)):
         }
 
 
+@app.get("/ready")
+def ready_check():
+    """就绪检查：模型加载和预热完成前返回 503"""
+    content = dict(readiness, vad_model=dict(vad_manager.stats(), pool=vad_state["pool"].stats() if vad_state["pool"] else None),
+                   asr_model=asr_manager.stats(), asr_queue=asr_queue.stats(), asr_batches=asr_batcher.stats(), streaming_asr_model=streaming_manager.stats())
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=content)
+
+
 @app.get("/vad/status")
 def get_status():
     closed_websockets = set()
@@ -306,7 +887,8 @@ def get_status():
 
     return {
         "is_running": bool(vad_state["active_websockets"]),
-        "active_connections": len(vad_state["active_websockets"])
+        "active_connections": len(vad_state["active_websockets"]),
+        "pool": vad_state["pool"].stats() if vad_state["pool"] else None
     }
 
 
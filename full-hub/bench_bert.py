@@ -0,0 +1,82 @@
+"""BERT 意图分类延迟基准测试
+
+对比 torch（CPU，有GPU时也测GPU）与 int8 量化 ONNX 后端的单条延迟（p50/p99）和批量吞吐，
+并输出两个标签（Vision、core memory）上的判定一致率。首次运行会先导出 ONNX 模型到 bert-hub/onnx。
+
+用法: python bench_bert.py --runs 200 --batch-sizes 8 32
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from onnx_backend import PARITY_TEXTS, label_parity, load_onnx_classifier, sigmoid
+
+# 模拟用户对话的样例句子，长短不一
+SAMPLE_TEXTS = PARITY_TEXTS + [
+    "你看看我现在打开的这个网页写的是什么",
+    "记住，我下周三要交论文",
+    "哈哈哈哈",
+    "今天下班路上看到一只很可爱的小狗，一直跟着我走了好久，最后被它的主人叫回去了",
+]
+
+
+def torch_predict(model, tokenizer, device):
+    def predict(texts):
+        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with torch.no_grad():
+            return torch.sigmoid(model(**inputs).logits).cpu().numpy()
+    return predict
+
+
+def latency(predict, texts, runs):
+    """逐条推理，返回 (p50, p99) 毫秒"""
+    predict(texts[:1])  # 预热
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        predict([texts[i % len(texts)]])
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+def throughput(predict, texts, batch_size, runs):
+    batch = [texts[i % len(texts)] for i in range(batch_size)]
+    predict(batch)  # 预热
+    start = time.perf_counter()
+    for _ in range(runs):
+        predict(batch)
+    return batch_size * runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BERT 意图分类延迟基准测试")
+    parser.add_argument("--model-path", default="bert-hub")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    backends = []
+    for device in ["cpu"] + (["cuda"] if torch.cuda.is_available() else []):
+        model = AutoModelForSequenceClassification.from_pretrained(args.model_path).to(device).eval()
+        backends.append((f"torch-{device}", torch_predict(model, tokenizer, device)))
+    onnx_model = load_onnx_classifier(args.model_path, args.threads, min_agreement=0.0)
+    backends.append(("onnx-int8", lambda texts: sigmoid(onnx_model.logits(texts))))
+
+    reference = backends[0][1](SAMPLE_TEXTS)
+    print(f"一致性（与 torch-cpu 比较）: {label_parity(reference, backends[-1][1](SAMPLE_TEXTS))}")
+
+    print(f"{'后端':<12} {'p50(ms)':>9} {'p99(ms)':>9}" + "".join(f" {f'batch{b} 条/秒':>14}" for b in args.batch_sizes))
+    for name, predict in backends:
+        p50, p99 = latency(predict, SAMPLE_TEXTS, args.runs)
+        rates = [throughput(predict, SAMPLE_TEXTS, b, max(1, args.runs // b)) for b in args.batch_sizes]
+        print(f"{name:<12} {p50:>9.2f} {p99:>9.2f}" + "".join(f" {r:>14.1f}" for r in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""RAG 检索延迟基准测试
+
+用随机向量模拟不同规模的记忆库，对比旧的 cosine_similarity + 全量 argsort
+与新的预归一化矩阵 + argpartition（以及 IVF 索引）的 /ask 检索耗时。
+问题编码的耗时与知识库规模无关，这里不计入。
+
+用法: python bench_rag.py --sizes 1000 10000 100000 --dim 1024
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rag_index import create_index
+
+try:
+    from sklearn.metrics.pairwise import cosine_similarity
+except ImportError:
+    cosine_similarity = None
+
+
+def legacy_search(question_embedding, knowledge_embeddings, top_k):
+    """旧版 /ask 的检索方式：每次查询重新归一化整个矩阵并全量排序"""
+    if cosine_similarity is not None:
+        similarities = cosine_similarity([question_embedding], knowledge_embeddings)[0]
+    else:
+        norms = np.linalg.norm(knowledge_embeddings, axis=1)
+        similarities = knowledge_embeddings @ question_embedding / (norms * np.linalg.norm(question_embedding))
+    return np.argsort(similarities)[::-1][:top_k]
+
+
+def make_embeddings(n, dim, rng):
+    """生成带聚类结构的随机向量，比纯高斯噪声更接近真实句向量的分布"""
+    centers = rng.standard_normal((max(1, n // 300), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def measure(fn, queries):
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 检索延迟基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"维度 {args.dim}，每组 {args.queries} 次查询，top_k={args.top_k}，单位 ms")
+    print(f"{'段落数':>8} {'方案':<22} {'p50':>8} {'p99':>8}")
+
+    for n in args.sizes:
+        embeddings = make_embeddings(n, args.dim, rng)
+        queries = embeddings[rng.integers(0, n, args.queries)] + 0.3 * rng.standard_normal(
+            (args.queries, args.dim)).astype(np.float32)
+        keys = [str(i) for i in range(n)]
+
+        cases = [("旧: cosine+argsort", lambda q: legacy_search(q, embeddings, args.top_k))]
+        for backend, dtype in [("brute", "float32"), ("brute", "float16"), ("ivf", "float32")]:
+            index = create_index(backend, args.dim, dtype)
+            index.add(keys, embeddings)
+            cases.append((f"新: {backend}/{dtype}", lambda q, index=index: index.search(q, args.top_k)))
+
+        for name, fn in cases:
+            fn(queries[0])  # 预热
+            p50, p99 = measure(fn, queries)
+            print(f"{n:>8} {name:<22} {p50:>8.3f} {p99:>8.3f}")
+
+        # 旧方案与新的暴力检索结果应一致
+        expected = legacy_search(queries[0], embeddings, args.top_k).tolist()
+        actual = [int(k) for k, _ in cases[1][1](queries[0])]
+        print(f"{'':>8} 结果一致: {expected == actual}")
+
+
+if __name__ == "__main__":
+    main()
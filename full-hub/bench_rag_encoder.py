@@ -0,0 +1,62 @@
+"""RAG 句向量编码吞吐基准测试
+
+对比 torch（CPU，有GPU时也测GPU）与 int8 量化 ONNX 后端的编码吞吐，
+并输出两者向量的余弦一致性。首次运行会先导出 ONNX 模型到 rag-hub/onnx。
+
+用法: python bench_rag_encoder.py --texts 256 --batch-sizes 1 8 32
+"""
+import argparse
+import os
+import time
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from onnx_backend import PARITY_TEXTS, cosine_parity, load_onnx_sentence_encoder
+from rag_text import iter_paragraphs
+
+
+def load_texts(path, count):
+    """优先用真实记忆库里的段落，没有则用样例句子凑数"""
+    texts = list(iter_paragraphs(path)) if os.path.exists(path) else []
+    if not texts:
+        texts = PARITY_TEXTS
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def throughput(encode, texts, batch_size):
+    encode(texts[:batch_size], batch_size=batch_size)  # 预热
+    start = time.perf_counter()
+    encode(texts, batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 句向量编码吞吐基准测试")
+    parser.add_argument("--model-path", default="./rag-hub")
+    parser.add_argument("--knowledge-base", default="../live-2d/AI记录室/记忆库.txt")
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = load_texts(args.knowledge_base, args.texts)
+
+    backends = [("torch-cpu", SentenceTransformer(args.model_path, device="cpu"))]
+    if torch.cuda.is_available():
+        backends.append(("torch-cuda", SentenceTransformer(args.model_path, device="cuda")))
+    onnx_model = load_onnx_sentence_encoder(args.model_path, args.threads, min_cosine=0.0)
+    backends.append(("onnx-int8", onnx_model))
+
+    reference = backends[0][1].encode(texts[:64])
+    print(f"一致性（与 torch-cpu 比较）: {cosine_parity(reference, onnx_model.encode(texts[:64]))}")
+
+    print(f"{'后端':<12} {'batch':>6} {'句/秒':>10}")
+    for name, model in backends:
+        for batch_size in args.batch_sizes:
+            rate = throughput(model.encode, texts, batch_size)
+            print(f"{name:<12} {batch_size:>6} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
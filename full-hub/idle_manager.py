@@ -0,0 +1,173 @@
+import asyncio
+import gc
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+def memory_usage():
+    """当前进程的内存占用和 CUDA 显存占用（字节），拿不到时为 None"""
+    rss = None
+    try:
+        import psutil
+        rss = psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    gpu = None
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        gpu = torch.cuda.memory_allocated()
+    return rss, gpu
+
+
+def _reclaimed(before, after):
+    if before is None or after is None:
+        return None
+    return max(0, before - after)
+
+
+class IdleModelManager:
+    """空闲模型管理：一段时间没有请求就卸载大模型，下次请求时再加载
+
+    load_fn() 加载并返回模型对象，unload_fn(model) 负责清掉服务里对模型的其他引用。
+    请求通过 use()（线程里）或 use_async()（事件循环里）拿到模型，用完前不会被卸载；
+    模型未加载时第一个请求负责加载，其余请求排队等它加载完成。
+    pinned=True 的模型只加载不卸载，比如很小的 VAD 模型。idle_seconds 为0时不卸载。
+    """
+
+    def __init__(self, name, load_fn, unload_fn=None, idle_seconds=1800.0, pinned=False, check_interval=30.0):
+        self.name = name
+        self.load_fn = load_fn
+        self.unload_fn = unload_fn
+        self.idle_seconds = idle_seconds
+        self.pinned = pinned
+        self.check_interval = check_interval
+
+        self.model = None
+        self.last_used = time.time()
+        self._active = 0
+        self._lock = threading.Lock()  # 加载、卸载以及活跃计数都在这把锁下进行
+        self._watcher = None
+
+        self.loads = 0
+        self.unloads = 0
+        self.initial_load_time = None
+        self.last_load_time = None
+        self.total_reload_time = 0.0
+        self.last_reclaimed = {"memory": None, "gpu_memory": None}
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """立即加载模型（服务启动时调用），并启动空闲检查线程"""
+        with self._lock:
+            self._ensure_loaded()
+        self._start_watcher()
+        return self.model
+
+    def _ensure_loaded(self):
+        if self.model is not None:
+            return
+        action = "加载" if self.loads == 0 else "重新加载"
+        print(f"正在{action}{self.name}模型...")
+        start_time = time.time()
+        self.model = self.load_fn()
+        self.last_load_time = time.time() - start_time
+        if self.loads == 0:
+            self.initial_load_time = self.last_load_time
+        else:
+            self.total_reload_time += self.last_load_time
+        self.loads += 1
+        print(f"{self.name}模型{action}完成，耗时 {self.last_load_time:.2f}s")
+
+    def _start_watcher(self):
+        if self._watcher is None and not self.pinned and self.idle_seconds > 0:
+            self._watcher = threading.Thread(target=self._watch, name=f"idle-{self.name}", daemon=True)
+            self._watcher.start()
+
+    def _enter(self):
+        with self._lock:
+            self._ensure_loaded()
+            self._active += 1
+            self.last_used = time.time()
+            return self.model
+
+    def _exit(self):
+        with self._lock:
+            self._active -= 1
+            self.last_used = time.time()
+
+    @contextmanager
+    def use(self):
+        """在线程里使用模型，未加载时当场加载"""
+        model = self._enter()
+        try:
+            yield model
+        finally:
+            self._exit()
+
+    @asynccontextmanager
+    async def use_async(self):
+        """在事件循环里使用模型；需要加载或锁被占用时到线程里等，不阻塞事件循环"""
+        model = None
+        if self._lock.acquire(blocking=False):
+            try:
+                if self.model is not None:
+                    self._active += 1
+                    self.last_used = time.time()
+                    model = self.model
+            finally:
+                self._lock.release()
+        if model is None:
+            model = await asyncio.get_running_loop().run_in_executor(None, self._enter)
+        try:
+            yield model
+        finally:
+            self._exit()
+
+    def unload(self, min_idle=0.0):
+        """卸载模型并释放内存；有请求正在使用、或空闲不足 min_idle 秒时不卸载"""
+        with self._lock:
+            if self.model is None or self._active > 0 or time.time() - self.last_used < min_idle:
+                return False
+            before = memory_usage()
+            if self.unload_fn is not None:
+                self.unload_fn(self.model)
+            self.model = None
+            gc.collect()
+            torch = sys.modules.get("torch")
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            after = memory_usage()
+            self.unloads += 1
+            self.last_reclaimed = {
+                "memory": _reclaimed(before[0], after[0]),
+                "gpu_memory": _reclaimed(before[1], after[1])
+            }
+        print(f"{self.name}模型空闲超过 {self.idle_seconds:.0f}s，已卸载，释放内存: {self.last_reclaimed}")
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            if self.model is not None and self._active == 0 and time.time() - self.last_used > self.idle_seconds:
+                self.unload(self.idle_seconds)
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "pinned": self.pinned,
+            "active": self._active,
+            "idle_seconds": self.idle_seconds,
+            "idle_for": time.time() - self.last_used,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "initial_load_time": self.initial_load_time,
+            "last_load_time": self.last_load_time,
+            "avg_reload_time": self.total_reload_time / (self.loads - 1) if self.loads > 1 else None,
+            "last_reclaimed": self.last_reclaimed
+        }
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """排队的任务已达上限，调用方应该稍后重试"""
+
+
+class InferenceQueue:
+    """有界推理队列：阻塞的模型推理放到线程池里跑，不占用事件循环
+
+    最多 concurrency 个任务同时推理，其余排队；排队数达到 max_pending 时 run() 直接抛出
+    QueueFullError，让调用方返回 503，而不是无限堆积请求、让每个人都等很久。
+    每个任务从提交到开始执行的等待时间都会记录下来，用来判断并发数和队列长度是否合适。
+    """
+
+    def __init__(self, concurrency=1, max_pending=16, name="inference", history=1000):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=history)  # 最近若干个任务的排队时间（秒）
+        self.max_wait = 0.0
+
+    async def run(self, fn, *args):
+        """把 fn(*args) 放进队列，等它执行完返回结果"""
+        with self._lock:
+            if self.waiting >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"排队任务已达上限 {self.max_pending}")
+            self.waiting += 1
+        enqueued = time.perf_counter()
+
+        def job():
+            wait = time.perf_counter() - enqueued
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+                self._waits.append(wait)
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        def on_done(future):
+            # 请求在开始执行前被取消（比如客户端断开），job 不会运行，这里补上排队计数
+            if future.cancelled():
+                with self._lock:
+                    self.waiting -= 1
+
+        future = self._executor.submit(job)
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            waits = np.array(self._waits, dtype=np.float64) * 1000
+            stats = {
+                "concurrency": self.concurrency,
+                "max_pending": self.max_pending,
+                "waiting": self.waiting,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "max_wait_ms": self.max_wait * 1000
+            }
+        if len(waits):
+            stats.update({
+                "avg_wait_ms": float(waits.mean()),
+                "p50_wait_ms": float(np.percentile(waits, 50)),
+                "p95_wait_ms": float(np.percentile(waits, 95))
+            })
+        return stats
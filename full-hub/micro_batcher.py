@@ -0,0 +1,125 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _bucket(n):
+    """直方图分桶：1, 2, 4, 8, ... 取不小于 n 的最小2的幂"""
+    size = 1
+    while size < n:
+        size *= 2
+    return size
+
+
+class MicroBatcher:
+    """动态批处理：把时间窗口内的并发请求合成一批，在后台线程里一次推理
+
+    process_fn 接收一个列表，返回与之一一对应、可按下标切片的结果（列表或数组）。
+    每个调用方 submit 一个或多个输入，拿到自己那一段结果。
+    """
+
+    def __init__(self, process_fn, max_batch_size=32, max_wait_ms=5.0, name="batcher"):
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = None
+        self._task = None
+        # 单线程执行器，保证同一时间只有一批在推理
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+        self.batches = 0
+        self.items = 0
+        self.batch_size_histogram = {}
+        self.queue_depth_histogram = {}
+
+    def start(self):
+        """在事件循环内启动后台批处理任务"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, inputs):
+        """提交一组输入，返回对应的结果；空输入直接返回空列表，不调用 process_fn"""
+        inputs = list(inputs)
+        if not inputs:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future))
+        return await future
+
+    async def _collect(self):
+        """取出第一个请求后，在窗口期内尽量凑满一批"""
+        first = await self._queue.get()
+        pending = [first]
+        count = len(first[0])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while count < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending, count
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending, count = await self._collect()
+            self._record(count, self._queue.qsize())
+
+            batch = [x for inputs, _ in pending for x in inputs]
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_fn, batch)
+            except Exception as e:
+                if len(pending) == 1:
+                    if not pending[0][1].done():
+                        pending[0][1].set_exception(e)
+                else:
+                    # 整批失败时逐个请求重跑，一个请求的坏输入不会连累同批的其他请求
+                    await self._run_each(pending)
+                continue
+
+            offset = 0
+            for inputs, future in pending:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(inputs)])
+                offset += len(inputs)
+
+    async def _run_each(self, pending):
+        loop = asyncio.get_running_loop()
+        for inputs, future in pending:
+            if future.done():
+                continue
+            try:
+                result = await loop.run_in_executor(self._executor, self.process_fn, inputs)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, batch_size, queue_depth):
+        self.batches += 1
+        self.items += batch_size
+        bucket = _bucket(batch_size)
+        self.batch_size_histogram[bucket] = self.batch_size_histogram.get(bucket, 0) + 1
+        bucket = _bucket(queue_depth) if queue_depth else 0
+        self.queue_depth_histogram[bucket] = self.queue_depth_histogram.get(bucket, 0) + 1
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_size_histogram.items())},
+            "queue_depth_histogram": {str(k): v for k, v in sorted(self.queue_depth_histogram.items())}
+        }
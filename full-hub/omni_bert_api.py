@@ -1,10 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
+import numpy as np
 from pydantic import BaseModel
+from typing import List
 import os
 import sys
 import re
+import time
+import asyncio
+import hashlib
+
+from idle_manager import IdleModelManager
+from micro_batcher import MicroBatcher
+from onnx_backend import load_onnx_classifier, sigmoid
+from text_cache import TextLRUCache, model_fingerprint, normalize_text
 
 # 保存原始stdout和stderr
 original_stdout = sys.stdout
@@ -48,33 +59,187 @@ app = FastAPI()
 class TextInput(BaseModel):
     text: str
 
+class TextBatchInput(BaseModel):
+    texts: List[str]
+
 # 检测是否有可用的GPU
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {device}")
 
 # 标签映射
 label_mapping = {"0": "否", "1": "是"}
+# 模型输出的两个标签，顺序与 logits 一致
+label_names = ["Vision", "core memory"]
+
+# 就绪状态：模型加载并预热完成后才算就绪
+readiness = {
+    "ready": False,
+    "load_time": None,
+    "warmup_time": None,
+    "error": None
+}
+loading_task = None  # 后台加载任务，保留引用防止被回收
 
 # 固定的模型路径
 model_path = "bert-hub"
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModelForSequenceClassification.from_pretrained(model_path)
+# 推理后端：torch / onnx / auto（auto 时有GPU用torch，纯CPU用int8量化的ONNX）；ONNX线程数0表示按可用核数自动设置
+BACKEND = os.environ.get("BERT_BACKEND", "auto")
+ONNX_THREADS = int(os.environ.get("BERT_ONNX_THREADS", "0")) or None
+model_backend = None
+# 模型空闲多少秒后卸载，下次请求时重新加载，0表示常驻
+IDLE_UNLOAD_SECONDS = float(os.environ.get("BERT_IDLE_UNLOAD_SECONDS", "1800"))
+# 动态批处理：最多等待 BATCH_WINDOW_MS 毫秒或凑满 MAX_BATCH_SIZE 条就推理一次
+BATCH_WINDOW_MS = float(os.environ.get("BERT_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.environ.get("BERT_MAX_BATCH_SIZE", "32"))
+# 分类结果缓存：容量为0时关闭；设置了缓存文件时定期落盘，重启后继续使用
+RESULT_CACHE_SIZE = int(os.environ.get("BERT_RESULT_CACHE_SIZE", "4096"))
+RESULT_CACHE_FILE = os.environ.get("BERT_RESULT_CACHE_FILE", "")
+RESULT_CACHE_SAVE_INTERVAL = float(os.environ.get("BERT_RESULT_CACHE_SAVE_INTERVAL", "60"))
 
-# 将模型移动到GPU
-model = model.to(device)
-model.eval()
 
-@app.post("/classify")
-async def classify_emotion(input_data: TextInput):
-    text = input_data.text
-    # 预测
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    inputs = {k: v.to(device) for k, v in inputs.items()}
+class ResultCache(TextLRUCache):
+    """分类概率的 LRU 缓存，以规范化文本（NFKC + 合并空白）的哈希为键
+
+    同一句话的分类结果是确定的，重复的问候、弹幕直接返回缓存的概率。
+    落盘文件里记录模型指纹，换了模型旧结果自动作废。
+    """
+
+    def __init__(self, max_size, fingerprint, path=""):
+        super().__init__(max_size)
+        self.fingerprint = fingerprint
+        self.path = path
+        self._dirty = False
+
+    def key(self, text):
+        return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+    def put(self, text, probabilities):
+        super().put(text, np.array(probabilities, dtype=np.float32))
+        self._dirty = True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["fingerprint"]) != self.fingerprint:
+                    print("分类缓存与当前模型不匹配，忽略")
+                    return
+                keys = data["keys"].tolist()
+                probabilities = data["probabilities"]
+            self.restore(zip(keys, probabilities))
+            print(f"分类缓存加载完成，共 {len(self._entries)} 条")
+        except Exception as e:
+            print(f"加载分类缓存失败: {e}")
+
+    def save(self):
+        """有新结果时写入缓存文件，按最近使用顺序保存"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        items = self.items()
+        keys = [key for key, _ in items]
+        probabilities = np.array([value for _, value in items], dtype=np.float32).reshape(len(keys), -1)
+        tmp_path = self.path + ".tmp.npz"
+        try:
+            np.savez(tmp_path, fingerprint=self.fingerprint, keys=np.array(keys, dtype=str), probabilities=probabilities)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存分类缓存失败: {e}")
+
+    def stats(self):
+        return dict(super().stats(), persistent=bool(self.path))
+
+
+def load_model():
+    global model_backend
+    if BACKEND == "onnx" or (BACKEND == "auto" and str(device) == "cpu"):
+        try:
+            onnx_model = load_onnx_classifier(model_path, ONNX_THREADS)
+            if onnx_model is not None:
+                model_backend = "onnx-int8"
+                return onnx_model
+        except Exception as e:
+            print(f"加载ONNX模型失败，退回torch推理: {e}")
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    # 将模型移动到GPU
+    model = model.to(device)
+    model.eval()
+    model_backend = f"torch-{device}"
+    return model
+
+
+# 分词器很小，常驻内存；模型由空闲管理器按需加载和卸载
+tokenizer = None
+model_manager = IdleModelManager("BERT", load_model, idle_seconds=IDLE_UNLOAD_SECONDS)
+result_cache = None
+
+
+def load_models():
+    """加载分词器、模型和结果缓存，在线程里运行，不阻塞服务启动"""
+    global tokenizer, result_cache
+
+    load_start = time.time()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model_manager.load()
+    print(f"推理后端: {model_backend}")
+
+    # 量化模型的概率和原模型略有差别，指纹里带上后端
+    result_cache = ResultCache(RESULT_CACHE_SIZE, f"{model_backend}-{model_fingerprint(model_path)}", RESULT_CACHE_FILE)
+    result_cache.load()
+    readiness["load_time"] = time.time() - load_start
+
+
+def predict_probabilities(texts):
+    """批量前向推理，每批 padding 到批内最长的一条，返回 (条数, 2) 的概率
+
+    按长度排序后再按 MAX_BATCH_SIZE 分批，长短差不多的放在一起，减少padding。
+    """
+    order = np.argsort([-len(t) for t in texts])
+    probabilities = np.zeros((len(texts), len(label_names)), dtype=np.float32)
 
-    with torch.no_grad():
-        outputs = model(**inputs)
-        probabilities = torch.sigmoid(outputs.logits).cpu().numpy()[0]
-        predictions = (probabilities > 0.5).astype(int)
+    with model_manager.use() as model, torch.no_grad():
+        for start in range(0, len(texts), MAX_BATCH_SIZE):
+            batch_ids = order[start:start + MAX_BATCH_SIZE]
+            batch = [texts[i] for i in batch_ids]
+            if model_backend == "onnx-int8":
+                probabilities[batch_ids] = sigmoid(model.logits(batch))
+                continue
+            inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512)
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+            outputs = model(**inputs)
+            probabilities[batch_ids] = torch.sigmoid(outputs.logits).cpu().numpy()
+    return probabilities
+
+
+# 把并发的 /classify 请求合成一批，在后台线程里推理，不阻塞事件循环
+classifier = MicroBatcher(predict_probabilities, MAX_BATCH_SIZE, BATCH_WINDOW_MS, name="bert-classifier")
+
+
+async def classify_texts(texts):
+    """返回每条文本的概率：先查结果缓存，没命中的去重后合批推理"""
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
+    results = [result_cache.get(text) for text in texts]
+    missing = list(dict.fromkeys(text for text, r in zip(texts, results) if r is None))
+    if missing:
+        computed = dict(zip(missing, await classifier.submit(missing)))
+        for text, probabilities in computed.items():
+            result_cache.put(text, probabilities)
+        results = [computed[text] if r is None else r for text, r in zip(texts, results)]
+    return results
+
+
+async def save_result_cache_periodically():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(RESULT_CACHE_SAVE_INTERVAL)
+        await loop.run_in_executor(None, result_cache.save)
+
+
+def format_result(text, probabilities):
+    predictions = (probabilities > 0.5).astype(int)
 
     # 转换为文本标签并分开返回
     result_labels = [label_mapping[str(pred)] for pred in predictions]
@@ -82,8 +247,71 @@ async def classify_emotion(input_data: TextInput):
     # 返回分开的标签结果
     return {
         "text": text,
-        "Vision": result_labels[0],  # 第一个标签
-        "core memory": result_labels[1]  # 第二个标签
+        label_names[0]: result_labels[0],  # 第一个标签
+        label_names[1]: result_labels[1]  # 第二个标签
+    }
+
+
+@app.on_event("startup")
+async def startup_event():
+    """启动批处理任务；模型加载和预热放到后台，端口先打开，加载完成前 /ready 返回 503"""
+    global loading_task
+    classifier.start()
+    loading_task = asyncio.get_running_loop().create_task(load_service())
+
+
+async def load_service():
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, load_models)
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"模型加载失败: {e}")
+        return
+
+    # 用样例句子跑一次推理，让第一个真实请求不用承担CUDA上下文初始化等开销
+    print("模型预热中...")
+    start_time = time.time()
+    try:
+        await classifier.submit(["帮我看看屏幕上是什么", "记住我明天要去医院"])
+    except Exception as e:
+        print(f"模型预热失败: {e}")
+    readiness["warmup_time"] = time.time() - start_time
+    readiness["ready"] = True
+    print(f"模型预热完成，耗时 {readiness['warmup_time']:.2f}s")
+
+    if RESULT_CACHE_FILE:
+        loop.create_task(save_result_cache_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if result_cache is not None:
+        result_cache.save()
+
+
+@app.get("/ready")
+async def ready_check():
+    """就绪检查：模型加载和预热完成前返回 503"""
+    content = dict(readiness, backend=model_backend, model=model_manager.stats(), batcher=classifier.stats(),
+                   cache=result_cache.stats() if result_cache is not None else None)
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=content)
+
+@app.post("/classify")
+async def classify_emotion(input_data: TextInput):
+    text = input_data.text
+    # 预测：与同一时间窗口内的其他请求合批推理
+    probabilities = (await classify_texts([text]))[0]
+    return format_result(text, probabilities)
+
+@app.post("/classify_batch")
+async def classify_batch(input_data: TextBatchInput):
+    """一次请求分类多条文本，结果按输入顺序返回"""
+    if not input_data.texts:
+        return {"results": []}
+    probabilities = await classify_texts(input_data.texts)
+    return {
+        "results": [format_result(text, p) for text, p in zip(input_data.texts, probabilities)]
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+import json
+import os
+
+import numpy as np
+
+# 用于导出后做一致性校验的样例句子
+PARITY_TEXTS = [
+    "你好呀，今天过得怎么样？",
+    "用户喜欢吃苹果，不喜欢香蕉。",
+    "昨天晚上我们一起看了一部很好看的电影，结局让人很感动。",
+    "记得提醒我明天早上八点开会",
+    "The quick brown fox jumps over the lazy dog.",
+    "我最喜欢的歌是《晴天》，每次听都会想起高中的时候。",
+    "帮我看看屏幕上是什么",
+    "2024年5月20日，用户说他养了一只叫小白的猫。",
+]
+
+
+def default_num_threads():
+    """推理线程数：本进程可用的核数，有 psutil 时不超过物理核数（超线程对矩阵运算帮助不大）"""
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False)
+    except ImportError:
+        physical = None
+    return max(1, min(available, physical or available))
+
+
+def create_session(onnx_path, num_threads=None):
+    """创建 ONNX Runtime 推理会话，线程数默认按可用核数设置"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = num_threads or default_num_threads()
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def export_int8(torch_model, tokenizer, export_dir, output_attr, output_axes):
+    """把 transformers 模型导出为 ONNX，并做动态 int8 量化
+
+    output_attr 是模型输出里要导出的字段（如 last_hidden_state、logits），
+    output_axes 是该输出的动态维度。返回量化后模型的路径。
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(export_dir, exist_ok=True)
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    int8_path = os.path.join(export_dir, "model.int8.onnx")
+
+    sample = tokenizer(PARITY_TEXTS[:2], padding=True, return_tensors="pt")
+    input_names = list(sample.keys())
+
+    class OutputWrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return getattr(self.model(**dict(zip(input_names, args))), output_attr)
+
+    torch_model = torch_model.to("cpu").eval()
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["output"] = output_axes
+
+    print("正在导出ONNX模型...")
+    with torch.no_grad():
+        torch.onnx.export(
+            OutputWrapper(torch_model),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    print("正在进行int8动态量化...")
+    # 大模型的 fp32 图会超过 protobuf 的2GB上限，统一使用外部数据格式
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+    return int8_path
+
+
+def cosine_parity(reference, candidate):
+    """逐行比较两组向量的余弦相似度"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    cos = np.sum(reference * candidate, axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1), 1e-12)
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
+
+
+class OnnxSentenceEncoder:
+    """用 ONNX Runtime 运行 int8 量化后的句向量模型，接口与 SentenceTransformer.encode 一致"""
+
+    def __init__(self, model_path, export_dir, config, num_threads=None):
+        from transformers import AutoTokenizer
+
+        self.config = config
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.session = create_session(os.path.join(export_dir, "model.int8.onnx"), num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dim"]
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self.config["dim"]), dtype=np.float32)
+
+        # 按长度排序后分批，减少padding
+        order = np.argsort([-len(t) for t in texts])
+        embeddings = np.zeros((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_ids = order[start:start + batch_size]
+            inputs = self.tokenizer([texts[i] for i in batch_ids], padding=True, truncation=True,
+                                    max_length=self.config["max_seq_length"], return_tensors="np")
+            feed = {k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            embeddings[batch_ids] = self._pool(hidden, inputs["attention_mask"])
+
+        if self.config["normalize"]:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def _pool(self, hidden, attention_mask):
+        if self.config["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def load_onnx_sentence_encoder(model_path, num_threads=None, min_cosine=0.98):
+    """加载（首次运行时先导出）int8 量化的句向量模型
+
+    导出结果缓存在 model_path/onnx 下。导出时会与 torch 的输出做一致性校验，
+    校验不通过返回 None，由调用方退回 torch 推理。
+    """
+    export_dir = os.path.join(model_path, "onnx")
+    config_path = os.path.join(export_dir, "encoder.json")
+
+    if not os.path.exists(config_path):
+        from sentence_transformers import SentenceTransformer, models
+
+        print("首次使用ONNX后端，开始导出并量化句向量模型...")
+        st_model = SentenceTransformer(model_path, device="cpu")
+        pooling = next(m for m in st_model if isinstance(m, models.Pooling))
+        config = {
+            "dim": st_model.get_sentence_embedding_dimension(),
+            "max_seq_length": st_model.max_seq_length,
+            "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+            "normalize": any(isinstance(m, models.Normalize) for m in st_model),
+        }
+
+        export_int8(st_model[0].auto_model, st_model.tokenizer, export_dir, "last_hidden_state",
+                    {0: "batch", 1: "sequence"})
+
+        # 与 torch 的结果比较，结果记录在配置里，以后启动不再重复校验
+        encoder = OnnxSentenceEncoder(model_path, export_dir, config, num_threads)
+        config["parity"] = cosine_parity(st_model.encode(PARITY_TEXTS), encoder.encode(PARITY_TEXTS))
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        del st_model
+    else:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        encoder = OnnxSentenceEncoder(model_path, export_dir, config, num_threads)
+
+    parity = config.get("parity", {})
+    print(f"ONNX一致性校验: {parity}")
+    if parity.get("min_cosine", 0.0) < min_cosine:
+        print(f"ONNX模型与torch输出差异过大（最低余弦 < {min_cosine}），退回torch推理")
+        return None
+    return encoder
+
+
+def sigmoid(logits):
+    return 1.0 / (1.0 + np.exp(-np.asarray(logits, dtype=np.float32)))
+
+
+def label_parity(reference, candidate, threshold=0.5):
+    """比较两组多标签概率：每个标签上判定结果一致的比例，以及概率的最大差值"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    agree = (reference > threshold) == (candidate > threshold)
+    return {
+        "label_agreement": float(agree.mean()),
+        "per_label_agreement": agree.mean(axis=0).tolist(),
+        "max_abs_diff": float(np.abs(reference - candidate).max())
+    }
+
+
+class OnnxSequenceClassifier:
+    """用 ONNX Runtime 运行 int8 量化后的多标签分类模型"""
+
+    def __init__(self, model_path, export_dir, config, num_threads=None):
+        from transformers import AutoTokenizer
+
+        self.config = config
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.session = create_session(os.path.join(export_dir, "model.int8.onnx"), num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def logits(self, texts):
+        """一批文本 padding 到批内最长的一条，返回 (条数, 标签数) 的 logits"""
+        inputs = self.tokenizer(list(texts), padding=True, truncation=True,
+                                max_length=self.config["max_length"], return_tensors="np")
+        feed = {k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def load_onnx_classifier(model_path, num_threads=None, min_agreement=1.0):
+    """加载（首次运行时先导出）int8 量化的分类模型
+
+    导出结果缓存在 model_path/onnx 下。导出时用样例句子与 torch 的判定结果逐标签比较，
+    一致率低于 min_agreement 时返回 None，由调用方退回 torch 推理。
+    """
+    export_dir = os.path.join(model_path, "onnx")
+    config_path = os.path.join(export_dir, "classifier.json")
+
+    if not os.path.exists(config_path):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        print("首次使用ONNX后端，开始导出并量化分类模型...")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        torch_model = AutoModelForSequenceClassification.from_pretrained(model_path).to("cpu").eval()
+        config = {"num_labels": torch_model.config.num_labels, "max_length": 512}
+
+        export_int8(torch_model, tokenizer, export_dir, "logits", {0: "batch"})
+
+        # 与 torch 的结果比较，结果记录在配置里，以后启动不再重复校验
+        classifier = OnnxSequenceClassifier(model_path, export_dir, config, num_threads)
+        with torch.no_grad():
+            inputs = tokenizer(PARITY_TEXTS, padding=True, truncation=True, max_length=512, return_tensors="pt")
+            reference = sigmoid(torch_model(**inputs).logits.numpy())
+        config["parity"] = label_parity(reference, sigmoid(classifier.logits(PARITY_TEXTS)))
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        del torch_model
+    else:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        classifier = OnnxSequenceClassifier(model_path, export_dir, config, num_threads)
+
+    parity = config.get("parity", {})
+    print(f"ONNX一致性校验: {parity}")
+    if parity.get("label_agreement", 0.0) < min_agreement:
+        print(f"ONNX模型与torch判定结果不一致（一致率 < {min_agreement}），退回torch推理")
+        return None
+    return classifier
@@ -0,0 +1,347 @@
+import os
+
+import numpy as np
+
+
+def l2_normalize(vectors):
+    """按行做L2归一化，归一化后内积即余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, top_k):
+    """返回得分最高的 top_k 个下标（从高到低），用 argpartition 避免全量排序"""
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def _scores(matrix, queries, block_rows=8192):
+    """矩阵与一个问题向量 (d,) 或一批问题 (B, d) 相乘，返回 (N,) 或 (N, B)
+
+    float16 矩阵在CPU上没有BLAS加速，分块转回 float32 再乘，避免整块复制。
+    """
+    if matrix.dtype == np.float32:
+        return matrix @ queries.T
+    scores = np.empty((len(matrix),) + queries.shape[:-1], dtype=np.float32)
+    for start in range(0, len(matrix), block_rows):
+        block = matrix[start:start + block_rows]
+        scores[start:start + len(block)] = block.astype(np.float32) @ queries.T
+    return scores
+
+
+class BruteForceIndex:
+    """暴力检索索引：一个归一化矩阵，每次查询与所有向量做内积
+
+    增删操作总是生成新数组而不原地修改，clone() 出来的副本可以放心修改，
+    旧快照里的索引仍然可以被并发查询。
+    """
+
+    kind = "brute"
+
+    def __init__(self, dim, dtype="float32"):
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self._keys = []
+        self._rows = {}
+        self._matrix = np.zeros((0, self.dim), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        return list(self._keys)
+
+    def clone(self):
+        other = BruteForceIndex(self.dim, self.dtype)
+        other._keys = list(self._keys)
+        other._rows = dict(self._rows)
+        other._matrix = self._matrix
+        return other
+
+    def add(self, keys, vectors):
+        keys = list(keys)
+        if not keys:
+            return
+        self._matrix = np.vstack([self._matrix, l2_normalize(vectors).astype(self.dtype)])
+        for k in keys:
+            self._rows[k] = len(self._keys)
+            self._keys.append(k)
+
+    def remove(self, keys):
+        drop = {k for k in keys if k in self._rows}
+        if not drop:
+            return
+        keep = np.array([k not in drop for k in self._keys], dtype=bool)
+        self._matrix = self._matrix[keep]
+        self._keys = [k for k in self._keys if k not in drop]
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+
+    def search(self, query, top_k):
+        """返回 [(键, 相似度), ...]，按相似度从高到低排列"""
+        if not self._keys:
+            return []
+        scores = _scores(self._matrix, l2_normalize(query))
+        return [(self._keys[i], float(scores[i])) for i in _top_k(scores, top_k)]
+
+    def search_batch(self, queries, top_ks):
+        """一次矩阵-矩阵乘法给一批问题打分，返回每个问题各自的 search() 结果"""
+        if not self._keys:
+            return [[] for _ in top_ks]
+        scores = _scores(self._matrix, l2_normalize(queries)).T
+        results = []
+        for row, top_k in zip(scores, top_ks):
+            results.append([(self._keys[i], float(row[i])) for i in _top_k(row, top_k)])
+        return results
+
+    def score_keys(self, query, keys):
+        """给指定段落的向量打分，返回与 keys 一一对应的相似度"""
+        if not keys:
+            return []
+        rows = [self._rows[k] for k in keys]
+        return _scores(self._matrix[rows], l2_normalize(query)).tolist()
+
+    def save(self, path):
+        _atomic_savez(path, kind=self.kind, dim=self.dim,
+                      keys=np.array(self._keys, dtype=str), matrix=self._matrix)
+
+    @classmethod
+    def _from_npz(cls, data, dtype="float32"):
+        index = cls(int(data["dim"]), dtype)
+        index.add(data["keys"].tolist(), data["matrix"])
+        return index
+
+
+class IVFFlatIndex:
+    """IVF-Flat 近似最近邻索引
+
+    用球面 k-means 把向量分到 nlist 个桶里，查询时只扫描与问题最接近的 nprobe 个桶。
+    向量数不足 min_train 时不训练，退化为单桶暴力检索；数据量增长到训练时的
+    retrain_ratio 倍后重新训练聚类中心。每个桶的数组同样只替换不原地修改。
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim, dtype="float32", nprobe=16, min_train=2048, retrain_ratio=4.0):
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.nprobe = int(nprobe)
+        self.min_train = int(min_train)
+        self.retrain_ratio = float(retrain_ratio)
+        self._centroids = None
+        self._trained_size = 0
+        # 每个桶是 (键列表, 向量矩阵)
+        self._lists = [([], np.zeros((0, self.dim), dtype=self.dtype))]
+        self._where = {}
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def keys(self):
+        return [k for list_keys, _ in self._lists for k in list_keys]
+
+    def clone(self):
+        other = IVFFlatIndex(self.dim, self.dtype, self.nprobe, self.min_train, self.retrain_ratio)
+        other._centroids = self._centroids
+        other._trained_size = self._trained_size
+        other._lists = list(self._lists)
+        other._where = dict(self._where)
+        return other
+
+    def _all_vectors(self):
+        keys = self.keys()
+        vectors = np.vstack([vecs for _, vecs in self._lists])
+        return keys, vectors
+
+    def _assign(self, vectors):
+        if self._centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def _train(self, vectors, iterations=10, seed=0):
+        """球面 k-means，训练样本最多取 nlist*256 条"""
+        nlist = max(1, min(int(np.sqrt(len(vectors))), 4096))
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if len(vectors) > nlist * 256:
+            sample = vectors[rng.choice(len(vectors), nlist * 256, replace=False)]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # 空桶重新随机挑一个样本当中心
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = l2_normalize(sums)
+        return centroids
+
+    def _rebuild(self, keys, vectors):
+        if len(keys) >= self.min_train:
+            self._centroids = self._train(vectors)
+            self._trained_size = len(keys)
+            print(f"IVF索引训练完成，{len(keys)} 个向量，{len(self._centroids)} 个桶")
+        else:
+            self._centroids = None
+            self._trained_size = 0
+
+        nlist = 1 if self._centroids is None else len(self._centroids)
+        assign = self._assign(vectors)
+        self._lists = []
+        self._where = {}
+        for list_no in range(nlist):
+            members = np.flatnonzero(assign == list_no)
+            list_keys = [keys[i] for i in members]
+            self._lists.append((list_keys, vectors[members]))
+            for k in list_keys:
+                self._where[k] = list_no
+
+    def add(self, keys, vectors):
+        keys = list(keys)
+        if not keys:
+            return
+        vectors = l2_normalize(vectors).astype(self.dtype)
+
+        total = len(self._where) + len(keys)
+        untrained_ready = self._centroids is None and total >= self.min_train
+        outgrown = self._centroids is not None and total > self._trained_size * self.retrain_ratio
+        if untrained_ready or outgrown:
+            old_keys, old_vectors = self._all_vectors()
+            self._rebuild(old_keys + keys, np.vstack([old_vectors, vectors]))
+            return
+
+        assign = self._assign(vectors)
+        for list_no in np.unique(assign):
+            members = np.flatnonzero(assign == list_no)
+            list_keys, list_vecs = self._lists[list_no]
+            new_keys = [keys[i] for i in members]
+            self._lists[list_no] = (list_keys + new_keys, np.vstack([list_vecs, vectors[members]]))
+            for k in new_keys:
+                self._where[k] = int(list_no)
+
+    def remove(self, keys):
+        by_list = {}
+        for k in keys:
+            if k in self._where:
+                by_list.setdefault(self._where.pop(k), set()).add(k)
+
+        for list_no, drop in by_list.items():
+            list_keys, list_vecs = self._lists[list_no]
+            keep = np.array([k not in drop for k in list_keys], dtype=bool)
+            self._lists[list_no] = ([k for k in list_keys if k not in drop], list_vecs[keep])
+
+    def search(self, query, top_k):
+        """返回 [(键, 相似度), ...]，按相似度从高到低排列"""
+        return self.search_batch(np.asarray(query)[None, :], [top_k])[0]
+
+    def search_batch(self, queries, top_ks):
+        """一批问题一次算出各自要扫描的桶，再逐个问题扫描"""
+        if not self._where:
+            return [[] for _ in top_ks]
+        queries = l2_normalize(queries)
+
+        if self._centroids is None:
+            probes = [[0]] * len(queries)
+        else:
+            probes = [_top_k(row, self.nprobe) for row in queries @ self._centroids.T]
+        return [self._search_lists(q, probe, top_k) for q, probe, top_k in zip(queries, probes, top_ks)]
+
+    def _search_lists(self, query, probe, top_k):
+        candidate_keys = []
+        candidate_scores = []
+        for list_no in probe:
+            list_keys, list_vecs = self._lists[list_no]
+            if list_keys:
+                candidate_keys.extend(list_keys)
+                candidate_scores.append(_scores(list_vecs, query))
+        if not candidate_keys:
+            return []
+
+        scores = np.concatenate(candidate_scores)
+        return [(candidate_keys[i], float(scores[i])) for i in _top_k(scores, top_k)]
+
+    def score_keys(self, query, keys):
+        """给指定段落的向量打分，返回与 keys 一一对应的相似度"""
+        if not keys:
+            return []
+        vectors = []
+        for k in keys:
+            list_keys, list_vecs = self._lists[self._where[k]]
+            vectors.append(list_vecs[list_keys.index(k)])
+        return _scores(np.vstack(vectors), l2_normalize(query)).tolist()
+
+    def save(self, path):
+        keys, vectors = self._all_vectors()
+        sizes = np.array([len(list_keys) for list_keys, _ in self._lists], dtype=np.int64)
+        centroids = self._centroids if self._centroids is not None else np.zeros((0, self.dim), dtype=np.float32)
+        _atomic_savez(path, kind=self.kind, dim=self.dim, keys=np.array(keys, dtype=str), matrix=vectors,
+                      sizes=sizes, centroids=centroids, trained_size=self._trained_size)
+
+    @classmethod
+    def _from_npz(cls, data, dtype="float32", **options):
+        index = cls(int(data["dim"]), dtype, **options)
+        keys = data["keys"].tolist()
+        vectors = data["matrix"].astype(index.dtype, copy=False)
+        centroids = data["centroids"]
+        if len(centroids) == 0:
+            index._rebuild(keys, vectors)
+            return index
+
+        index._centroids = centroids
+        index._trained_size = int(data["trained_size"])
+        index._lists = []
+        start = 0
+        for list_no, size in enumerate(data["sizes"].tolist()):
+            list_keys = keys[start:start + size]
+            index._lists.append((list_keys, vectors[start:start + size]))
+            for k in list_keys:
+                index._where[k] = list_no
+            start += size
+        return index
+
+
+def create_index(backend, dim, dtype="float32", **options):
+    """按配置名创建索引，options 只对 IVF 生效"""
+    if backend == IVFFlatIndex.kind:
+        return IVFFlatIndex(dim, dtype, **options)
+    if backend == BruteForceIndex.kind:
+        return BruteForceIndex(dim, dtype)
+    raise ValueError(f"未知的索引类型: {backend}，可选: brute, ivf")
+
+
+def load_index(path, backend, dim, dtype="float32", **options):
+    """从磁盘加载索引，类型或维度不匹配时返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["kind"]) != backend or int(data["dim"]) != int(dim):
+                print("索引文件与当前配置不匹配，重新构建")
+                return None
+            if backend == IVFFlatIndex.kind:
+                return IVFFlatIndex._from_npz(data, dtype, **options)
+            return BruteForceIndex._from_npz(data, dtype)
+    except Exception as e:
+        print(f"加载索引文件失败: {e}")
+        return None
+
+
+def _atomic_savez(path, **arrays):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
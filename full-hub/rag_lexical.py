@@ -0,0 +1,161 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+# 中日韩文字按字切分，其余按连续的字母数字切分
+_CJK_PATTERN = r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]'
+TOKEN_PATTERN = re.compile(f'({_CJK_PATTERN}+)|((?:(?!{_CJK_PATTERN})[^\\W_])+)')
+
+
+def tokenize(text):
+    """BM25 分词：中文取单字和相邻两字（字符 n-gram），英文单词和数字整体作为一个词
+
+    单字保证单个字也能命中，两字组合让 "小白"、"晴天" 这类名字比零散的单字得分更高。
+    """
+    tokens = []
+    text = unicodedata.normalize("NFKC", text).lower()
+    for cjk, word in TOKEN_PATTERN.findall(text):
+        if word:
+            tokens.append(word)
+            continue
+        tokens.extend(cjk)
+        tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+class BM25Index:
+    """可增量更新的 BM25 倒排索引
+
+    每个词的倒排表是一对不可变数组（文档槽位, 词频），增删时整体替换而不原地修改，
+    与向量索引一样 clone() 出来的副本可以放心修改，旧快照照常查询。
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # 词 -> (槽位数组, 词频数组)
+        self._slots = {}  # 段落键 -> 槽位
+        self._slot_keys = []  # 槽位 -> 段落键，删除后留空等待复用
+        self._free = []
+        self._doc_terms = {}  # 段落键 -> 该段落包含的词，删除时用
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def clone(self):
+        other = BM25Index(self.k1, self.b)
+        other._postings = dict(self._postings)
+        other._slots = dict(self._slots)
+        other._slot_keys = list(self._slot_keys)
+        other._free = list(self._free)
+        other._doc_terms = dict(self._doc_terms)
+        other._lengths = self._lengths.copy()
+        other._total_length = self._total_length
+        return other
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        slot = len(self._slot_keys)
+        self._slot_keys.append(None)
+        if slot >= len(self._lengths):
+            lengths = np.zeros(max(16, 2 * len(self._lengths)), dtype=np.float32)
+            lengths[:len(self._lengths)] = self._lengths
+            self._lengths = lengths
+        return slot
+
+    def add(self, keys, texts):
+        """按批加入段落，同一批里每个词的倒排表只拼接一次"""
+        additions = {}
+        for key, text in zip(keys, texts):
+            if key in self._slots:
+                continue
+            tokens = tokenize(text)
+            slot = self._allocate()
+            self._slots[key] = slot
+            self._slot_keys[slot] = key
+            self._lengths[slot] = len(tokens)
+            self._total_length += len(tokens)
+
+            counts = Counter(tokens)
+            self._doc_terms[key] = tuple(counts)
+            for token, tf in counts.items():
+                entry = additions.get(token)
+                if entry is None:
+                    additions[token] = ([slot], [tf])
+                else:
+                    entry[0].append(slot)
+                    entry[1].append(tf)
+
+        for token, (slots, tfs) in additions.items():
+            slots = np.array(slots, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            old = self._postings.get(token)
+            if old is not None:
+                slots = np.concatenate([old[0], slots])
+                tfs = np.concatenate([old[1], tfs])
+            self._postings[token] = (slots, tfs)
+
+    def remove(self, keys):
+        removals = {}
+        for key in keys:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                continue
+            for token in self._doc_terms.pop(key):
+                removals.setdefault(token, []).append(slot)
+            self._total_length -= int(self._lengths[slot])
+            self._lengths[slot] = 0
+            self._slot_keys[slot] = None
+            self._free.append(slot)
+
+        for token, slots in removals.items():
+            old_slots, old_tfs = self._postings[token]
+            keep = ~np.isin(old_slots, slots)
+            if keep.any():
+                self._postings[token] = (old_slots[keep], old_tfs[keep])
+            else:
+                del self._postings[token]
+
+    def search(self, query, top_k):
+        """返回 [(键, BM25得分), ...]，只包含至少命中一个词的段落"""
+        count = len(self._slots)
+        if not count or top_k <= 0:
+            return []
+
+        avg_length = self._total_length / count
+        scores = np.zeros(len(self._slot_keys), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            slots, tfs = posting
+            idf = math.log(1.0 + (count - len(slots) + 0.5) / (len(slots) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._lengths[slots] / avg_length)
+            scores[slots] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(scores[hits], -top_k)[-top_k:]]
+        hits = hits[np.argsort(scores[hits])[::-1]]
+        return [(self._slot_keys[i], float(scores[i])) for i in hits]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """倒数排名融合：每个列表里排第 r 名的结果得 1/(k+r) 分，累加后取前 top_k
+
+    只看名次不看原始得分，余弦相似度和 BM25 分数不在一个量纲也能直接合并。
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (key, _) in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
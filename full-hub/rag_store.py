@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from text_cache import TextLRUCache, normalize_text
+
+
+class EmbeddingStore:
+    """按内容寻址的嵌入缓存
+
+    每个段落以 "模型ID + 段落文本" 的哈希为键，向量以 float32 追加写入
+    内存映射矩阵文件，行号顺序记录在旁路索引文件中（一行一个键）。
+    """
+
+    def __init__(self, cache_dir, model_id, dim):
+        self.model_id = model_id
+        self.dim = int(dim)
+        # 不同模型各用一个子目录，避免维度不一致
+        model_tag = hashlib.sha1(model_id.encode("utf-8")).hexdigest()[:16]
+        self.cache_dir = os.path.join(cache_dir, model_tag)
+        self.matrix_path = os.path.join(self.cache_dir, "embeddings.f32")
+        self.keys_path = os.path.join(self.cache_dir, "keys.txt")
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def key(self, text):
+        """段落的内容地址"""
+        return hashlib.sha1(f"{self.model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("model_id") != self.model_id or meta.get("dim") != self.dim:
+                print("嵌入缓存与当前模型不匹配，清空缓存")
+                self._reset()
+                return
+        else:
+            self._reset()
+            return
+
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                keys = [line.strip() for line in f if line.strip()]
+
+        # 以矩阵文件实际大小为准，丢弃写了一半的尾部
+        row_bytes = self.dim * 4
+        matrix_rows = os.path.getsize(self.matrix_path) // row_bytes if os.path.exists(self.matrix_path) else 0
+        count = min(len(keys), matrix_rows)
+        if count != len(keys) or count != matrix_rows:
+            self._truncate(keys[:count], count)
+
+        self.rows = {k: i for i, k in enumerate(keys[:count])}
+        self._remap(count)
+        print(f"嵌入缓存加载完成，共 {count} 条")
+
+    def _reset(self):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"model_id": self.model_id, "dim": self.dim}, f, ensure_ascii=False)
+        open(self.matrix_path, 'wb').close()
+        open(self.keys_path, 'w', encoding='utf-8').close()
+        self.rows = {}
+        self._matrix = None
+
+    def _truncate(self, keys, count):
+        with open(self.matrix_path, 'r+b') as f:
+            f.truncate(count * self.dim * 4)
+        with open(self.keys_path, 'w', encoding='utf-8') as f:
+            f.writelines(k + "\n" for k in keys)
+
+    def _remap(self, count):
+        if count == 0:
+            self._matrix = None
+        else:
+            self._matrix = np.memmap(self.matrix_path, dtype='<f4', mode='r', shape=(count, self.dim))
+
+    def _append(self, keys, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype='<f4')
+        # 先写矩阵再写键，中途崩溃时多出的矩阵行会在下次加载时被截掉
+        with open(self.matrix_path, 'ab') as f:
+            f.write(embeddings.tobytes())
+        with open(self.keys_path, 'a', encoding='utf-8') as f:
+            f.writelines(k + "\n" for k in keys)
+
+        start = len(self.rows)
+        for i, k in enumerate(keys):
+            self.rows[k] = start + i
+        self._remap(len(self.rows))
+
+    def get_or_encode(self, texts, encode_fn):
+        """返回 texts 对应的嵌入矩阵，只对缓存中没有的段落调用 encode_fn"""
+        with self._lock:
+            keys = [self.key(t) for t in texts]
+
+            missing = {}
+            for k, t in zip(keys, texts):
+                if k not in self.rows and k not in missing:
+                    missing[k] = t
+
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+            if missing:
+                new_embeddings = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+                self._append(list(missing.keys()), new_embeddings)
+
+            if not keys:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            return np.asarray(self._matrix[[self.rows[k] for k in keys]], dtype=np.float32)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class QueryEmbeddingCache(TextLRUCache):
+    """问题向量的 LRU 缓存
+
+    以规范化后的问题文本（NFKC + 合并空白）加模型ID为键，容量和过期时间可配置。
+    知识库重新加载不影响问题向量，只有换模型（模型ID变化）才会失效。
+    """
+
+    def __init__(self, model_id, max_size=1024, ttl=3600.0):
+        super().__init__(max_size, ttl)
+        self.model_id = model_id
+
+    def key(self, text):
+        return f"{self.model_id}\x00{normalize_text(text)}"
+
+    def put(self, text, embedding):
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        super().put(text, embedding)
@@ -0,0 +1,82 @@
+import re
+
+# 10个或更多连续的横线作为段落分隔符（前后空白在切分后统一strip掉）
+SEPARATOR_PATTERN = re.compile(r'-{10,}')
+
+
+def iter_paragraphs(file_path, chunk_size=1 << 20, min_length=10):
+    """流式读取记忆库文件，逐段产出段落
+
+    按块读取文件，不把整个文件读进一个字符串；跨块边界的分隔符会保留到下一块再判断。
+    过滤规则与一次性 re.split 相同：去掉首尾空白后长度大于 min_length 的段落才保留。
+    """
+    buffer = ""
+    scan_from = 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+            start = 0
+            next_scan = None
+            for match in SEPARATOR_PATTERN.finditer(buffer, scan_from):
+                if match.end() == len(buffer) and not eof:
+                    # 横线一直延续到块末尾，可能还没结束，等下一块再切
+                    next_scan = match.start()
+                    break
+                section = buffer[start:match.start()].strip()
+                if len(section) > min_length:
+                    yield section
+                start = match.end()
+
+            buffer = buffer[start:]
+            if eof:
+                break
+            # 下一轮只需从可能构成分隔符的位置开始扫描，避免长段落被反复扫描；
+            # 末尾不足10个的横线可能和下一块拼成分隔符，所以回退9个字符
+            if next_scan is not None:
+                scan_from = next_scan - start
+            else:
+                scan_from = max(0, len(buffer) - 9)
+
+    section = buffer.strip()
+    if len(section) > min_length:
+        yield section
+
+
+def batched(iterable, size):
+    """把可迭代对象按 size 分批"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def split_windows(text, max_tokens, overlap=0, offsets_fn=None):
+    """把长段落切成按 token 数限长、相邻之间有重叠的窗口
+
+    offsets_fn(text) 返回每个 token 在原文中的字符区间 [(start, end), ...]，
+    不提供时按一个字符一个 token 计算。不超过 max_tokens 的段落原样返回。
+    """
+    # WordPiece 的每个 token 至少覆盖一个字符，字符数不超限的段落不必分词
+    if max_tokens <= 0 or len(text) <= max_tokens:
+        return [text]
+    offsets = offsets_fn(text) if offsets_fn else [(i, i + 1) for i in range(len(text))]
+    if len(offsets) <= max_tokens:
+        return [text]
+
+    step = max(1, max_tokens - overlap)
+    windows = []
+    for start in range(0, len(offsets), step):
+        end = min(start + max_tokens, len(offsets))
+        window = text[offsets[start][0]:offsets[end - 1][1]].strip()
+        if window:
+            windows.append(window)
+        if end == len(offsets):
+            break
+    return windows
@@ -1,18 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import torch
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import uvicorn
 import time
 import os
 import sys
 import re
+import json
+import base64
+import asyncio
+import difflib
 import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from rag_store import EmbeddingStore, QueryEmbeddingCache
+from text_cache import model_fingerprint
+from rag_index import create_index, load_index, l2_normalize
+from micro_batcher import MicroBatcher
+from idle_manager import IdleModelManager
+from onnx_backend import load_onnx_sentence_encoder
+from rag_text import iter_paragraphs, batched, split_windows
+from rag_lexical import BM25Index, reciprocal_rank_fusion
 
 # 保存原始stdout和stderr
 original_stdout = sys.stdout
@@ -51,43 +63,239 @@ log_file = open(os.path.join(LOGS_DIR, 'rag.log'), 'w', encoding='utf-8')
 sys.stdout = TeeOutput(original_stdout, log_file)
 sys.stderr = TeeOutput(original_stderr, log_file)
 
-# 全局变量
-model = None
-knowledge_base = []
-knowledge_embeddings = None
-reload_lock = threading.Lock()
+# 模型、知识库与缓存路径
+MODEL_PATH = "./rag-hub"
+KNOWLEDGE_BASE_PATH = "../live-2d/AI记录室/记忆库.txt"
+EMBEDDING_CACHE_DIR = "rag-cache"
 
+# 推理设备与编码后端：torch / onnx / auto（auto 时有GPU用torch，纯CPU用int8量化的ONNX）
+DEVICE = os.environ.get("RAG_DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+ENCODER_BACKEND = os.environ.get("RAG_ENCODER_BACKEND", "auto")
+ONNX_THREADS = int(os.environ.get("RAG_ONNX_THREADS", "0")) or None
 
-class KnowledgeBaseHandler(FileSystemEventHandler):
-    """监控记忆库文件变化"""
+# 向量索引配置：brute 为暴力检索，ivf 为近似最近邻（适合十万级以上段落）
+INDEX_BACKEND = os.environ.get("RAG_INDEX_BACKEND", "brute")
+IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", "16"))
+# 索引内归一化向量的存储精度，float16 省一半内存，但CPU上没有半精度矩阵乘法，查询会变慢
+EMBEDDING_DTYPE = os.environ.get("RAG_EMBEDDING_DTYPE", "float32")
 
-    def on_modified(self, event):
-        if not event.is_directory and event.src_path.endswith("记忆库.txt"):
-            time.sleep(0.5)  # 等待文件写入完成
-            reload_knowledge_base()
+# 检索方式：hybrid 为向量检索 + BM25 关键词检索做倒数排名融合，dense 为只用向量检索
+RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL_MODE", "hybrid")
+# 融合前两路各取的候选数量，以及倒数排名融合的平滑常数
+FUSION_DEPTH = int(os.environ.get("RAG_FUSION_DEPTH", "50"))
+RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
 
+# 编码请求的动态批处理：最多等待 BATCH_WINDOW_MS 毫秒或凑满 MAX_BATCH_SIZE 条就推理一次
+BATCH_WINDOW_MS = float(os.environ.get("RAG_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.environ.get("RAG_MAX_BATCH_SIZE", "32"))
 
-def load_knowledge_base(file_path="../live-2d/AI记录室/记忆库.txt"):
-    """加载知识库文件 - 使用连续横线分割段落"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+# 编码模型空闲多少秒后卸载，下次请求时重新加载，0表示常驻
+IDLE_UNLOAD_SECONDS = float(os.environ.get("RAG_IDLE_UNLOAD_SECONDS", "1800"))
+
+# 知识库段落每批编码的数量
+EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", "256"))
+
+# 长段落切分：超过 CHUNK_TOKENS 个 token 的段落切成有 CHUNK_OVERLAP 个 token 重叠的窗口分别索引，0表示不切分
+CHUNK_TOKENS = int(os.environ.get("RAG_CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", "32"))
+
+# 文件变化后的重新加载：最后一次事件后静默 RELOAD_DEBOUNCE_MS 毫秒，
+# 且间隔 RELOAD_STABLE_MS 毫秒两次检查文件大小和修改时间都不变，才开始重建
+RELOAD_DEBOUNCE_MS = float(os.environ.get("RAG_RELOAD_DEBOUNCE_MS", "500"))
+RELOAD_STABLE_MS = float(os.environ.get("RAG_RELOAD_STABLE_MS", "200"))
+
+# 问题向量缓存：容量为0时关闭，过期时间单位秒，0表示不过期
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.environ.get("RAG_QUERY_CACHE_TTL", "3600"))
+
+# 多角色知识库配置文件，格式 {"角色名": "记忆库文件路径", ...}；
+# default 知识库始终存在，指向 KNOWLEDGE_BASE_PATH
+COLLECTIONS_FILE = os.environ.get("RAG_COLLECTIONS_FILE", "rag_collections.json")
+DEFAULT_COLLECTION = "default"
+# 同时常驻内存的知识库数量，超出后按最近最少使用卸载
+MAX_LOADED_COLLECTIONS = int(os.environ.get("RAG_MAX_LOADED_COLLECTIONS", "4"))
+
+
+class KnowledgeSnapshot:
+    """知识库的只读快照：段落、窗口键、向量索引和 BM25 索引，发布后不再修改
+
+    索引里存的是窗口（短段落本身就是一个窗口），parents 记录每个窗口键所属的段落下标。
+    索引的增删只在 clone() 出来的副本上进行，旧快照的索引保持不变。
+    """
 
-        paragraphs = []
+    __slots__ = ("paragraphs", "keys", "index", "lexical", "parents", "texts")
 
-        # 使用正则表达式匹配10个以上连续的横线
-        # 匹配10个或更多连续的横线（可能前后有空格）
-        separator_pattern = r'\s*-{10,}\s*'
+    def __init__(self, paragraphs=(), keys=(), index=None, lexical=None, parents=()):
+        self.paragraphs = tuple(paragraphs)
+        self.keys = tuple(keys)
+        self.index = index
+        self.lexical = lexical
+        self.parents = {}
+        for key, parent in zip(self.keys, parents):
+            self.parents.setdefault(key, parent)
+        self.texts = {key: self.paragraphs[parent] for key, parent in self.parents.items()}
 
-        # 按分隔符分割内容
-        sections = re.split(separator_pattern, content)
 
-        for section in sections:
-            section = section.strip()
-            # 过滤掉空内容和过短的内容
-            if section and len(section) > 10:
-                paragraphs.append(section)
+# 全局变量
+model = None
+model_backend = None
+model_manager = None  # 负责按需加载、空闲卸载编码模型
+chunk_tokenizer = None  # 切分窗口用的分词器，不随模型卸载，保证窗口切法不变
+encoder = None  # 接口请求统一通过它编码，不阻塞事件循环
+embedding_store = None  # 所有知识库共用，按内容寻址
+query_cache = None
+collections = {}  # 知识库名 -> KnowledgeCollection
+collections_lock = threading.Lock()
+# 就绪状态：模型加载并预热完成后才算就绪，/health 只表示进程存活
+readiness = {
+    "ready": False,
+    "load_time": None,
+    "warmup_time": None,
+    "error": None
+}
+loading_task = None  # 后台加载任务，保留引用防止被回收
+
+# 预热用的样例问题，长短不一，覆盖不同的序列长度
+WARMUP_TEXTS = [
+    "你好",
+    "用户喜欢吃什么水果？",
+    "昨天晚上我们一起看了一部电影，你还记得电影的名字和结局吗？"
+]
+
+
+class KnowledgeBaseHandler(FileSystemEventHandler):
+    """监控某个知识库的记忆文件变化，只通知调度器，不在监控线程里重建"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _notify(self, path):
+        if os.path.abspath(path) == self.collection.file_path:
+            self.collection.scheduler.notify()
 
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+    def on_moved(self, event):
+        # 编辑器常用 "写临时文件再改名" 的方式保存
+        if not event.is_directory:
+            self._notify(event.dest_path)
+
+
+class ReloadScheduler:
+    """知识库重新加载的调度器：防抖、合并连续事件，文件稳定后在后台线程重建
+
+    每个文件事件让代数加一。后台线程等到一段时间内没有新事件、文件大小和修改时间
+    也不再变化时才重建；重建期间又来了新事件，这次的结果直接丢弃，重新等待。
+    丢弃的重建已编码的段落仍留在嵌入缓存里，下一次重建不用再编码。
+    """
+
+    def __init__(self, collection, debounce_ms=RELOAD_DEBOUNCE_MS, stable_ms=RELOAD_STABLE_MS):
+        self.collection = collection
+        self.debounce = debounce_ms / 1000.0
+        self.stable = stable_ms / 1000.0
+        self.generation = 0
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._worker = None
+
+        self.events = 0
+        self.reloads = 0
+        self.dropped = 0
+
+    def notify(self):
+        """记录一次文件事件，需要时启动后台线程"""
+        with self._cond:
+            self.generation += 1
+            self.events += 1
+            self._last_event = time.monotonic()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"reload-{self.collection.name}", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def is_stale(self, generation):
+        return generation != self.generation
+
+    def _wait_quiet(self):
+        """等到最后一次事件之后静默够 debounce 秒，返回此时的代数"""
+        with self._cond:
+            while True:
+                remaining = self._last_event + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    return self.generation
+                self._cond.wait(remaining)
+
+    def _file_stable(self):
+        """间隔一小段时间比较两次文件大小和修改时间"""
+        try:
+            before = os.stat(self.collection.file_path)
+            time.sleep(self.stable)
+            after = os.stat(self.collection.file_path)
+        except OSError:
+            return False
+        return (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns)
+
+    def _run(self):
+        try:
+            self._loop()
+        finally:
+            # 意外退出时也要清掉，否则之后的事件不会再启动后台线程
+            with self._cond:
+                if self._worker is threading.current_thread():
+                    self._worker = None
+
+    def _loop(self):
+        while True:
+            generation = self._wait_quiet()
+            if not os.path.exists(self.collection.file_path):
+                # 文件被删除了，先退出；重新创建或移动回来时 on_created/on_moved 会再启动后台线程
+                with self._cond:
+                    if self.generation == generation:
+                        self._worker = None
+                        return
+                continue
+
+            if not self._file_stable():
+                # 文件还在写，当作一次新事件继续等
+                with self._cond:
+                    if self.generation == generation:
+                        self._last_event = time.monotonic()
+                continue
+
+            try:
+                reloaded = self.collection.reload(lambda: self.is_stale(generation))
+            except Exception as e:
+                print(f"重新加载知识库 {self.collection.name} 失败: {str(e)}")
+                reloaded = False
+            if reloaded:
+                self.reloads += 1
+            else:
+                self.dropped += 1
+
+            with self._cond:
+                if self.generation == generation:
+                    self._worker = None
+                    return
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "events": self.events,
+            "reloads": self.reloads,
+            "dropped": self.dropped
+        }
+
+
+def load_knowledge_base(file_path=KNOWLEDGE_BASE_PATH):
+    """加载知识库文件 - 使用连续横线分割段落，按块流式读取，不把整个文件读进内存"""
+    try:
+        paragraphs = list(iter_paragraphs(file_path))
         print(f"知识库加载完成，共 {len(paragraphs)} 个段落")
         return paragraphs
 
@@ -96,18 +304,271 @@ def load_knowledge_base(file_path="../live-2d/AI记录室/记忆库.txt"):
         return []
 
 
-def reload_knowledge_base():
-    """重新加载知识库"""
-    global knowledge_base, knowledge_embeddings
+def get_model_id(model_path, dim):
+    """根据模型目录下的文件名和大小生成模型ID，换模型后缓存自动失效"""
+    return f"{os.path.basename(os.path.abspath(model_path))}-{dim}-{model_fingerprint(model_path)[:12]}"
+
+
+def load_encoder_model():
+    """按设备和配置加载句向量模型，返回 (模型, 后端名)"""
+    if ENCODER_BACKEND == "onnx" or (ENCODER_BACKEND == "auto" and DEVICE == "cpu"):
+        try:
+            onnx_model = load_onnx_sentence_encoder(MODEL_PATH, ONNX_THREADS)
+            if onnx_model is not None:
+                return onnx_model, "onnx-int8"
+        except Exception as e:
+            print(f"加载ONNX模型失败，退回torch推理: {e}")
+
+    return SentenceTransformer(MODEL_PATH, device=DEVICE), f"torch-{DEVICE}"
+
 
-    with reload_lock:
-        print("检测到文件变化，重新加载知识库...")
-        new_knowledge_base = load_knowledge_base()
+def load_model():
+    """供空闲管理器调用，加载编码模型"""
+    global model, model_backend
+    model, model_backend = load_encoder_model()
+    print(f"模型加载完成，推理后端: {model_backend}")
+    return model
 
-        if new_knowledge_base and model is not None:
-            knowledge_base = new_knowledge_base
-            knowledge_embeddings = model.encode(knowledge_base)
+
+def release_model(_):
+    global model
+    model = None
+
+
+def encode_texts(texts):
+    """编码文本；模型因空闲被卸载时先重新加载，加载期间的请求在批处理队列里排队"""
+    with model_manager.use() as m:
+        return m.encode(texts)
+
+
+def token_offsets(text):
+    """段落里每个 token 的字符区间，用编码模型自己的分词器计算"""
+    if chunk_tokenizer is None or not getattr(chunk_tokenizer, "is_fast", False):
+        return [(i, i + 1) for i in range(len(text))]
+    return chunk_tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+
+def chunk_paragraphs(paragraphs):
+    """把段落展开成窗口，返回 (窗口文本列表, 每个窗口所属的段落下标)"""
+    windows = []
+    parents = []
+    for i, paragraph in enumerate(paragraphs):
+        for window in split_windows(paragraph, CHUNK_TOKENS, CHUNK_OVERLAP, token_offsets):
+            windows.append(window)
+            parents.append(i)
+    if len(windows) > len(paragraphs):
+        print(f"长段落切分完成，{len(paragraphs)} 个段落共 {len(windows)} 个窗口")
+    return windows, parents
+
+
+def embed_paragraphs(paragraphs):
+    """生成段落嵌入，已缓存的段落直接从磁盘读取"""
+    embeddings = embedding_store.get_or_encode(paragraphs, encode_texts)
+    stats = embedding_store.stats()
+    print(f"嵌入缓存命中率: {stats['hit_rate']:.1%}（共 {stats['entries']} 条）")
+    return embeddings
+
+
+def diff_index(old_keys, index, lexical, new_paragraphs, new_keys):
+    """对比新旧段落键序列，在索引副本上只删除移除的段落、只编码新增的段落
+
+    lexical 不为 None 时同样增量更新 BM25 索引。返回 (向量索引, BM25索引)。
+    """
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+
+    removed = set()
+    inserted = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        removed.update(old_keys[i1:i2])
+        for j in range(j1, j2):
+            inserted.setdefault(new_keys[j], new_paragraphs[j])
+
+    # 段落只是挪了位置时键不变，既不删除也不重新编码
+    new_key_set = set(new_keys)
+    removed = [k for k in removed if k not in new_key_set]
+
+    new_lexical = None
+    if lexical is not None:
+        new_lexical = lexical.clone()
+        new_lexical.remove(removed)
+        new_lexical.add(list(inserted), list(inserted.values()))
+
+    new_index = index.clone()
+    new_index.remove(removed)
+    inserted = {k: text for k, text in inserted.items() if k not in new_index}
+    # 分批编码并加入索引，大批量新增时内存占用可控，已编码的部分也会先落到嵌入缓存
+    for batch in batched(inserted.items(), EMBED_BATCH_SIZE):
+        new_index.add([k for k, _ in batch], embed_paragraphs([text for _, text in batch]))
+
+    print(f"增量更新：新增 {len(inserted)} 个段落，移除 {len(removed)} 个段落")
+    return new_index, new_lexical
+
+
+def build_lexical(paragraphs, keys):
+    """从头建 BM25 索引（分词很快，不落盘，每次加载时重建）"""
+    if RETRIEVAL_MODE != "hybrid":
+        return None
+    lexical = BM25Index()
+    lexical.add(keys, paragraphs)
+    return lexical
+
+
+class KnowledgeCollection:
+    """一个命名的知识库：独立的记忆文件、索引、文件监控和快照，共用同一个编码模型
+
+    首次查询时才加载；被LRU淘汰后只释放内存，下次用到时从磁盘上的索引和嵌入缓存恢复。
+    """
+
+    def __init__(self, name, file_path):
+        self.name = name
+        self.file_path = os.path.abspath(file_path)
+        self.index_path = os.path.splitext(self.file_path)[0] + f".{INDEX_BACKEND}.index.npz"
+        # 查询端直接读取当前快照引用，不加锁；重建完成后整体替换为新快照
+        self.snapshot = KnowledgeSnapshot()
+        self.loaded = False
+        self.last_used = 0.0
+        self._lock = threading.Lock()  # 串行化加载、重建和卸载
+        self._observer = None
+        self.scheduler = ReloadScheduler(self)
+
+    def acquire(self):
+        """取当前快照；已加载时不加锁直接返回，未加载时先加载"""
+        self.last_used = time.time()
+        if self.loaded:
+            return self.snapshot
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            return self.snapshot
+
+    def _load(self):
+        start_time = time.time()
+        dim = embedding_store.dim
+
+        # 加载上次保存的索引，没有则新建
+        index = load_index(self.index_path, INDEX_BACKEND, dim, EMBEDDING_DTYPE, nprobe=IVF_NPROBE)
+        if index is None:
+            index = create_index(INDEX_BACKEND, dim, EMBEDDING_DTYPE, nprobe=IVF_NPROBE)
+        else:
+            print(f"知识库 {self.name} 索引加载完成，共 {len(index)} 条")
+
+        # 只为索引中缺少的段落生成嵌入
+        paragraphs = load_knowledge_base(self.file_path)
+        windows, parents = chunk_paragraphs(paragraphs)
+        keys = [embedding_store.key(w) for w in windows]
+        index, _ = diff_index(index.keys(), index, None, windows, keys)
+        self.snapshot = KnowledgeSnapshot(paragraphs, keys, index, build_lexical(windows, keys), parents)
+        self.loaded = True
+        self._save_index(index)
+
+        # 启动文件监控
+        watch_dir = os.path.dirname(self.file_path)
+        if os.path.isdir(watch_dir):
+            self._observer = Observer()
+            self._observer.schedule(KnowledgeBaseHandler(self), watch_dir, recursive=False)
+            self._observer.start()
+
+        print(f"知识库 {self.name} 加载完成，索引类型: {INDEX_BACKEND}，耗时 {time.time() - start_time:.2f}s")
+
+    def reload(self, is_stale=None):
+        """增量重新加载知识库，构建好新快照后一次性发布，查询不用等待编码
+
+        is_stale() 在发布前检查，返回 True 说明重建期间文件又变了，丢弃本次结果。
+        发布了新快照返回 True。
+        """
+        with self._lock:
+            if not self.loaded or model_manager is None:
+                return False
+
+            print(f"检测到知识库 {self.name} 文件变化，重新加载...")
+            new_paragraphs = load_knowledge_base(self.file_path)
+            if not new_paragraphs:
+                return False
+
+            old_snapshot = self.snapshot
+            new_windows, new_parents = chunk_paragraphs(new_paragraphs)
+            new_keys = [embedding_store.key(w) for w in new_windows]
+            new_index, new_lexical = diff_index(list(old_snapshot.keys), old_snapshot.index, old_snapshot.lexical,
+                                                new_windows, new_keys)
+
+            if is_stale is not None and is_stale():
+                print(f"知识库 {self.name} 重建期间文件又有变化，丢弃本次结果")
+                return False
+
+            self.snapshot = KnowledgeSnapshot(new_paragraphs, new_keys, new_index, new_lexical, new_parents)
             print("知识库更新完成！")
+            self._save_index(new_index)
+            return True
+
+    def unload(self):
+        """释放内存中的快照并停止文件监控，索引和嵌入仍保留在磁盘上"""
+        with self._lock:
+            if not self.loaded:
+                return
+            observer, self._observer = self._observer, None
+            self.snapshot = KnowledgeSnapshot()
+            self.loaded = False
+        # 监控线程可能正在等锁执行 reload，要在释放锁之后再停止
+        if observer is not None:
+            observer.stop()
+        print(f"知识库 {self.name} 长时间未使用，已从内存卸载")
+
+    def _save_index(self, index):
+        """把索引保存到记忆文件旁边，下次加载直接使用"""
+        try:
+            index.save(self.index_path)
+        except Exception as e:
+            print(f"保存索引失败: {e}")
+
+    def stats(self):
+        return {
+            "file": self.file_path,
+            "loaded": self.loaded,
+            "size": len(self.snapshot.paragraphs),
+            "last_used": self.last_used,
+            "reload": self.scheduler.stats()
+        }
+
+
+def load_collections_config():
+    """读取多角色知识库配置"""
+    config = {DEFAULT_COLLECTION: KNOWLEDGE_BASE_PATH}
+    if os.path.exists(COLLECTIONS_FILE):
+        try:
+            with open(COLLECTIONS_FILE, 'r', encoding='utf-8') as f:
+                config.update(json.load(f))
+        except Exception as e:
+            print(f"读取知识库配置失败: {e}")
+    return config
+
+
+def evict_collections(keep):
+    """常驻内存的知识库超过上限时，卸载最久没用的"""
+    with collections_lock:
+        loaded = [c for c in collections.values() if c.loaded and c is not keep]
+        loaded.sort(key=lambda c: c.last_used)
+        for collection in loaded[:max(0, len(loaded) + 1 - MAX_LOADED_COLLECTIONS)]:
+            collection.unload()
+
+
+async def get_snapshot(name):
+    """取知识库的当前快照，未加载的知识库在线程中加载，不阻塞事件循环"""
+    collection = collections.get(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"知识库不存在: {name}")
+
+    if collection.loaded:
+        snapshot = collection.acquire()
+    else:
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, collection.acquire)
+        await loop.run_in_executor(None, evict_collections, collection)
+
+    if not snapshot.paragraphs:
+        raise HTTPException(status_code=404, detail="知识库未加载")
+    return snapshot
 
 
 # 创建FastAPI应用
@@ -116,41 +577,92 @@ app = FastAPI(title="BGE API", version="1.0.0")
 
 @app.on_event("startup")
 async def startup_event():
-    global model, knowledge_base, knowledge_embeddings
+    global loading_task
 
     print("启动BGE API服务...")
-    print("加载模型...")
+    # 模型加载和预热放到后台，端口先打开；加载完成前 /ready 返回 503，其他接口也返回 503
+    loading_task = asyncio.get_running_loop().create_task(load_service())
 
-    # 加载模型
-    model = SentenceTransformer("./rag-hub")
-    model = model.to('cuda')
-    print("模型加载完成，使用GPU")
 
-    # 加载知识库
-    knowledge_base = load_knowledge_base()
-    if knowledge_base:
-        print("生成知识库嵌入...")
-        knowledge_embeddings = model.encode(knowledge_base)
-        print("知识库嵌入完成")
+async def load_service():
+    global encoder
 
-    # 启动文件监控
-    event_handler = KnowledgeBaseHandler()
-    observer = Observer()
-    observer.schedule(event_handler, "../live-2d/AI记录室", recursive=False)
-    observer.start()
-    print("文件监控启动完成")
+    start_time = time.time()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_models)
+        encoder = MicroBatcher(encode_texts, MAX_BATCH_SIZE, BATCH_WINDOW_MS, name="rag-encoder")
+        encoder.start()
+        readiness["load_time"] = time.time() - start_time
+
+        await warmup()
+        readiness["ready"] = True
+        print("API服务启动完成！")
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"API服务启动失败: {e}")
 
-    print("API服务启动完成！")
+
+def load_models():
+    """加载模型、嵌入缓存和默认知识库，在线程里运行"""
+    global model_manager, chunk_tokenizer, embedding_store, query_cache
+
+    print("加载模型...")
+    model_manager = IdleModelManager("BGE", load_model, release_model, IDLE_UNLOAD_SECONDS)
+    model_manager.load()
+    chunk_tokenizer = getattr(model, "tokenizer", None)
+
+    # 打开嵌入缓存
+    dim = model.get_sentence_embedding_dimension()
+    model_id = get_model_id(MODEL_PATH, dim)
+    if model_backend == "onnx-int8":
+        # 量化模型的向量和原模型略有差别，单独缓存
+        model_id += "-onnx-int8"
+    embedding_store = EmbeddingStore(EMBEDDING_CACHE_DIR, model_id, dim)
+    query_cache = QueryEmbeddingCache(model_id, QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+    # 注册所有知识库，默认知识库立即加载，其余在第一次查询时加载
+    for name, file_path in load_collections_config().items():
+        collections[name] = KnowledgeCollection(name, file_path)
+    print(f"已注册知识库: {', '.join(collections)}")
+
+    print("生成知识库嵌入...")
+    collections[DEFAULT_COLLECTION].acquire()
+
+
+async def warmup():
+    """用样例问题走一遍编码和检索，让第一个真实请求不用承担分词器初始化、CUDA上下文等开销"""
+    print("模型预热中...")
+    start_time = time.time()
+    try:
+        embeddings = await encoder.submit(WARMUP_TEXTS)
+        snapshot = collections[DEFAULT_COLLECTION].snapshot
+        if snapshot.paragraphs:
+            for text, embedding in zip(WARMUP_TEXTS, embeddings):
+                hits = snapshot.index.search(embedding, search_depth(snapshot, 3))
+                rank_hits(snapshot, text, embedding, hits, 3)
+    except Exception as e:
+        print(f"模型预热失败: {e}")
+    readiness["warmup_time"] = time.time() - start_time
+    print(f"模型预热完成，耗时 {readiness['warmup_time']:.2f}s")
 
 
 # 请求模型
 class TextRequest(BaseModel):
     text: str
+    # float 为 JSON 数组；base64 为小端字节的 base64 字符串（与 OpenAI 的 encoding_format 一致）
+    encoding_format: str = "float"
+    # base64 和二进制响应使用的精度：float32 或 float16
+    dtype: str = "float32"
 
 
 class QuestionRequest(BaseModel):
     question: str
     top_k: int = 3
+    collection: str = DEFAULT_COLLECTION
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[QuestionRequest]
 
 
 class SimilarityRequest(BaseModel):
@@ -160,7 +672,7 @@ class SimilarityRequest(BaseModel):
 
 # 响应模型
 class EmbeddingResponse(BaseModel):
-    embedding: List[float]
+    embedding: Union[List[float], str]
     dimension: int
     processing_time: float
 
@@ -171,31 +683,155 @@ class AnswerResponse(BaseModel):
     processing_time: float
 
 
+class BatchAnswerResponse(BaseModel):
+    results: List[AnswerResponse]
+    processing_time: float
+
+
 class SimilarityResponse(BaseModel):
     similarity: float
     processing_time: float
 
 
+EMBEDDING_FORMATS = ("float", "base64")
+BINARY_DTYPES = ("float32", "float16")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+def check_embedding_format(encoding_format, dtype):
+    if encoding_format not in EMBEDDING_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的 encoding_format: {encoding_format}")
+    if dtype not in BINARY_DTYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的 dtype: {dtype}")
+
+
+def pack_embeddings(embeddings, dtype):
+    """向量按行拼成小端字节串，不逐个浮点数做JSON序列化"""
+    return np.ascontiguousarray(embeddings, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+
+
+def wants_binary(http_request):
+    """客户端在 Accept 里要求 application/octet-stream 时直接返回原始字节"""
+    return BINARY_MEDIA_TYPE in http_request.headers.get("accept", "")
+
+
+def binary_response(embeddings, dtype, processing_time):
+    """二进制响应：正文为 (数量, 维度) 的小端矩阵，形状和精度放在响应头里"""
+    # 空输入时编码结果可能是一维空数组，统一成 (数量, 维度)
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, embedding_store.dim)
+    return Response(
+        content=pack_embeddings(embeddings, dtype),
+        media_type=BINARY_MEDIA_TYPE,
+        headers={
+            "X-Embedding-Count": str(embeddings.shape[0]),
+            "X-Embedding-Dimension": str(embeddings.shape[1]),
+            "X-Embedding-Dtype": dtype,
+            "X-Processing-Time": f"{processing_time:.6f}"
+        }
+    )
+
+
+async def encode_queries(texts):
+    """编码问题文本：命中问题向量缓存的直接返回，其余合批送去编码"""
+    embeddings = [query_cache.get(t) for t in texts]
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+
+    if missing:
+        new_embeddings = await encoder.submit([texts[i] for i in missing])
+        for i, embedding in zip(missing, new_embeddings):
+            query_cache.put(texts[i], embedding)
+            embeddings[i] = embedding
+
+    return np.stack(embeddings)
+
+
+def search_depth(snapshot, top_k):
+    """向量索引要取的候选数：混合检索要留给融合排序，有窗口时同一段落可能占多个名次"""
+    depth = top_k
+    if snapshot.lexical is not None:
+        depth = max(depth, FUSION_DEPTH)
+    if len(snapshot.keys) > len(snapshot.paragraphs):
+        depth = max(depth, top_k * 4)
+    return depth
+
+
+def rank_hits(snapshot, question, question_embedding, dense_hits, top_k):
+    """融合关键词检索结果并把窗口合并回段落，返回前 top_k 个 [(窗口键, 余弦相似度), ...]"""
+    hits = fuse_lexical(snapshot, question, question_embedding, dense_hits, len(dense_hits))
+    return collapse_windows(snapshot, hits, top_k)
+
+
+def fuse_lexical(snapshot, question, question_embedding, dense_hits, depth):
+    """向量检索结果与 BM25 结果做倒数排名融合，按融合名次返回 [(键, 余弦相似度), ...]"""
+    if snapshot.lexical is None:
+        return dense_hits
+
+    lexical_hits = snapshot.lexical.search(question, FUSION_DEPTH)
+    fused = reciprocal_rank_fusion([dense_hits, lexical_hits], depth, RRF_K)
+
+    # 只被 BM25 召回的段落补算余弦相似度，返回字段的含义保持不变
+    similarities = dict(dense_hits)
+    missing = [k for k, _ in fused if k not in similarities]
+    similarities.update(zip(missing, snapshot.index.score_keys(question_embedding, missing)))
+    return [(k, similarities[k]) for k, _ in fused]
+
+
+def collapse_windows(snapshot, hits, top_k):
+    """同一段落的多个窗口只保留排名最靠前的一个"""
+    seen = set()
+    results = []
+    for key, score in hits:
+        if len(results) >= top_k:
+            break
+        parent = snapshot.parents[key]
+        if parent in seen:
+            continue
+        seen.add(parent)
+        results.append((key, score))
+    return results
+
+
+def build_passages(snapshot, hits):
+    """把索引返回的 (键, 相似度) 转换成接口返回的段落列表"""
+    relevant_passages = []
+    for i, (key, score) in enumerate(hits):
+        relevant_passages.append({
+            "rank": i + 1,
+            "similarity": score,
+            "content": snapshot.texts[key]
+        })
+    return relevant_passages
+
+
 @app.get("/")
 async def root():
     return {
         "message": "BGE API服务运行中",
         "model_loaded": model is not None,
-        "knowledge_base_size": len(knowledge_base)
+        "knowledge_base_size": len(collections[DEFAULT_COLLECTION].snapshot.paragraphs) if collections else 0
     }
 
 
 @app.post("/encode", response_model=EmbeddingResponse)
-async def encode_text(request: TextRequest):
-    if model is None:
-        raise HTTPException(status_code=500, detail="模型未加载")
+async def encode_text(request: TextRequest, http_request: Request):
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
+    check_embedding_format(request.encoding_format, request.dtype)
 
     start_time = time.time()
-    embedding = model.encode([request.text])[0]
+    embedding = (await encode_queries([request.text]))[0]
     processing_time = time.time() - start_time
 
+    if wants_binary(http_request):
+        return binary_response(embedding[None, :], request.dtype, processing_time)
+
+    if request.encoding_format == "base64":
+        encoded = base64.b64encode(pack_embeddings(embedding, request.dtype)).decode("ascii")
+    else:
+        encoded = embedding.tolist()
+
     return EmbeddingResponse(
-        embedding=embedding.tolist(),
+        embedding=encoded,
         dimension=len(embedding),
         processing_time=processing_time
     )
@@ -203,12 +839,12 @@ async def encode_text(request: TextRequest):
 
 @app.post("/similarity", response_model=SimilarityResponse)
 async def calculate_similarity(request: SimilarityRequest):
-    if model is None:
-        raise HTTPException(status_code=500, detail="模型未加载")
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
 
     start_time = time.time()
-    embeddings = model.encode([request.text1, request.text2])
-    similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
+    embeddings = l2_normalize(await encode_queries([request.text1, request.text2]))
+    similarity = embeddings[0] @ embeddings[1]
     processing_time = time.time() - start_time
 
     return SimilarityResponse(
@@ -219,42 +855,157 @@ async def calculate_similarity(request: SimilarityRequest):
 
 @app.post("/ask", response_model=AnswerResponse)
 async def ask_question(request: QuestionRequest):
-    if model is None:
-        raise HTTPException(status_code=500, detail="模型未加载")
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
 
-    if not knowledge_base:
-        raise HTTPException(status_code=404, detail="知识库未加载")
+    # 取当前快照的引用，之后即使知识库被重建也不影响本次查询
+    snapshot = await get_snapshot(request.collection)
 
-    with reload_lock:  # 确保查询时数据不会被更新
-        start_time = time.time()
+    start_time = time.time()
 
-        question_embedding = model.encode([request.question])
-        similarities = cosine_similarity(question_embedding, knowledge_embeddings)[0]
-        top_indices = np.argsort(similarities)[::-1][:request.top_k]
+    question_embedding = (await encode_queries([request.question]))[0]
+    hits = snapshot.index.search(question_embedding, search_depth(snapshot, request.top_k))
+    hits = rank_hits(snapshot, request.question, question_embedding, hits, request.top_k)
+    relevant_passages = build_passages(snapshot, hits)
 
-        relevant_passages = []
-        for i, idx in enumerate(top_indices):
-            relevant_passages.append({
-                "rank": i + 1,
-                "similarity": float(similarities[idx]),
-                "content": knowledge_base[idx]
-            })
+    processing_time = time.time() - start_time
 
-        processing_time = time.time() - start_time
+    return AnswerResponse(
+        question=request.question,
+        relevant_passages=relevant_passages,
+        processing_time=processing_time
+    )
+
+
+@app.post("/ask_batch", response_model=BatchAnswerResponse)
+async def ask_batch(request: BatchQuestionRequest):
+    """一次请求检索多个问题：一次前向编码所有问题，一次矩阵乘法打分，按请求顺序返回"""
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
+
+    if not request.questions:
+        return BatchAnswerResponse(results=[], processing_time=0.0)
+
+    # 按知识库分组，每个知识库一次矩阵乘法
+    groups = {}
+    for i, q in enumerate(request.questions):
+        groups.setdefault(q.collection, []).append(i)
+    snapshots = {name: await get_snapshot(name) for name in groups}
+
+    start_time = time.time()
 
-        return AnswerResponse(
-            question=request.question,
+    question_embeddings = await encode_queries([q.question for q in request.questions])
+    passages = [None] * len(request.questions)
+    for name, ids in groups.items():
+        snapshot = snapshots[name]
+        depths = [search_depth(snapshot, request.questions[i].top_k) for i in ids]
+        group_hits = snapshot.index.search_batch(question_embeddings[ids], depths)
+        for i, hits in zip(ids, group_hits):
+            q = request.questions[i]
+            hits = rank_hits(snapshot, q.question, question_embeddings[i], hits, q.top_k)
+            passages[i] = build_passages(snapshot, hits)
+
+    processing_time = time.time() - start_time
+
+    results = []
+    for q, relevant_passages in zip(request.questions, passages):
+        results.append(AnswerResponse(
+            question=q.question,
             relevant_passages=relevant_passages,
             processing_time=processing_time
-        )
+        ))
+
+    return BatchAnswerResponse(results=results, processing_time=processing_time)
+
+
+@app.post("/v1/embeddings")
+async def openai_embeddings(request: dict, http_request: Request):
+    """兼容 OpenAI embeddings API 格式，用于 mem0
+
+    支持 encoding_format=base64；Accept 为 application/octet-stream 时返回原始小端字节。
+    """
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail="模型加载中")
+    encoding_format = request.get("encoding_format") or "float"
+    dtype = request.get("dtype") or "float32"
+    check_embedding_format(encoding_format, dtype)
+
+    # 获取输入文本
+    input_text = request.get("input", "")
+
+    # 处理列表或字符串输入；只支持文本，不支持 token ID 形式的输入
+    if isinstance(input_text, list):
+        texts = input_text
+    else:
+        texts = [input_text]
+    if not all(isinstance(text, str) for text in texts):
+        raise HTTPException(status_code=400, detail="input 必须是字符串或字符串列表")
+
+    # 生成嵌入
+    start_time = time.time()
+    embeddings = await encoder.submit(texts)
+
+    if wants_binary(http_request):
+        return binary_response(embeddings, dtype, time.time() - start_time)
+
+    # 构造 OpenAI 格式响应
+    data = []
+    for i, embedding in enumerate(embeddings):
+        if encoding_format == "base64":
+            encoded = base64.b64encode(pack_embeddings(embedding, dtype)).decode("ascii")
+        else:
+            encoded = embedding.tolist()
+        data.append({
+            "object": "embedding",
+            "embedding": encoded,
+            "index": i
+        })
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": request.get("model", "bge-model"),
+        "usage": {
+            "prompt_tokens": sum(len(text) for text in texts),
+            "total_tokens": sum(len(text) for text in texts)
+        }
+    }
+
+
+@app.get("/collections")
+async def list_collections():
+    return {name: collection.stats() for name, collection in collections.items()}
+
+
+@app.get("/ready")
+async def ready_check():
+    """就绪检查：模型加载和预热完成前返回 503"""
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
 
 
 @app.get("/health")
 async def health_check():
+    default = collections.get(DEFAULT_COLLECTION)
     return {
         "status": "healthy",
+        "ready": readiness["ready"],
         "model_loaded": model is not None,
-        "knowledge_base_loaded": len(knowledge_base) > 0
+        "model_backend": model_backend,
+        "knowledge_base_loaded": default is not None and len(default.snapshot.paragraphs) > 0,
+        "embedding_cache": embedding_store.stats() if embedding_store else None,
+        "encoder": encoder.stats() if encoder else None,
+        "model_manager": model_manager.stats() if model_manager else None,
+        "query_cache": query_cache.stats() if query_cache else None,
+        "index": {
+            "backend": INDEX_BACKEND,
+            "dtype": EMBEDDING_DTYPE,
+            "retrieval_mode": RETRIEVAL_MODE
+        },
+        "collections": {
+            "loaded": sum(1 for c in collections.values() if c.loaded),
+            "registered": len(collections),
+            "max_loaded": MAX_LOADED_COLLECTIONS
+        }
     }
 
 
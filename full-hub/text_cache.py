@@ -0,0 +1,92 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """缓存键用的文本规范化：NFKC + 合并空白，全角半角、多余空格不同的同一句话命中同一条"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def model_fingerprint(path):
+    """模型目录里配置和权重文件的名字与大小，用来判断缓存是否还有效，换模型后缓存自动失效"""
+    fingerprint = hashlib.sha1()
+    for name in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+        full_path = os.path.join(path, name)
+        if os.path.isfile(full_path):
+            fingerprint.update(f"{name}:{os.path.getsize(full_path)};".encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+class TextLRUCache:
+    """以规范化文本为键的线程安全 LRU 缓存
+
+    max_size 为0时关闭缓存；ttl 大于0时条目超过 ttl 秒作废。子类可以重写 key() 给键加上模型ID等前缀。
+    """
+
+    def __init__(self, max_size=1024, ttl=0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # 键 -> (值, 写入时间)
+        self._lock = threading.Lock()
+
+    def key(self, text):
+        return normalize_text(text)
+
+    def get(self, text):
+        if self.max_size <= 0:
+            return None
+        key = self.key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text, value):
+        if self.max_size <= 0:
+            return
+        key = self.key(text)
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def items(self):
+        """按最近使用顺序返回 [(键, 值), ...]，最近用过的在最后"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def restore(self, items):
+        """用 [(键, 值), ...] 替换全部条目，超出容量时只保留最后的"""
+        items = list(items)[-self.max_size:] if self.max_size > 0 else []
+        now = time.time()
+        with self._lock:
+            self._entries = OrderedDict((key, (value, now)) for key, value in items)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
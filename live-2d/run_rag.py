@@ -51,11 +51,30 @@ log_file = open(os.path.join(LOGS_DIR, 'rag.log'), 'w', encoding='utf-8')
 sys.stdout = TeeOutput(original_stdout, log_file)
 sys.stderr = TeeOutput(original_stderr, log_file)
 
+
+class KnowledgeSnapshot:
+    """知识库的只读快照：段落、原始嵌入和归一化矩阵，发布后不再修改"""
+
+    __slots__ = ("paragraphs", "embeddings", "normalized")
+
+    def __init__(self, paragraphs=(), embeddings=None):
+        self.paragraphs = tuple(paragraphs)
+        self.embeddings = embeddings
+        self.normalized = None
+
+        if embeddings is not None:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self.normalized = embeddings / np.maximum(norms, 1e-12)
+            # 冻结数组，防止读者和写者共享的数据被原地修改
+            self.embeddings.flags.writeable = False
+            self.normalized.flags.writeable = False
+
+
 # 全局变量
 model = None
-knowledge_base = []
-knowledge_embeddings = None
-reload_lock = threading.Lock()
+# 查询端直接读取当前快照引用，不加锁；重建完成后整体替换为新快照
+knowledge_snapshot = KnowledgeSnapshot()
+reload_lock = threading.Lock()  # 只用于串行化重建任务
 
 
 class KnowledgeBaseHandler(FileSystemEventHandler):
@@ -97,16 +116,15 @@ def load_knowledge_base(file_path="./live-2d/AI记录室/记忆库.txt"):
 
 
 def reload_knowledge_base():
-    """重新加载知识库"""
-    global knowledge_base, knowledge_embeddings
+    """重新加载知识库，构建好新快照后一次性发布，查询不用等待编码"""
+    global knowledge_snapshot
 
     with reload_lock:
         print("检测到文件变化，重新加载知识库...")
         new_knowledge_base = load_knowledge_base()
 
         if new_knowledge_base and model is not None:
-            knowledge_base = new_knowledge_base
-            knowledge_embeddings = model.encode(knowledge_base)
+            knowledge_snapshot = KnowledgeSnapshot(new_knowledge_base, model.encode(new_knowledge_base))
             print("知识库更新完成！")
 
 
@@ -116,7 +134,7 @@ app = FastAPI(title="BGE API", version="1.0.0")
 
 @app.on_event("startup")
 async def startup_event():
-    global model, knowledge_base, knowledge_embeddings
+    global model, knowledge_snapshot
 
     print("启动BGE API服务...")
     print("加载模型...")
@@ -130,7 +148,7 @@ async def startup_event():
     knowledge_base = load_knowledge_base()
     if knowledge_base:
         print("生成知识库嵌入...")
-        knowledge_embeddings = model.encode(knowledge_base)
+        knowledge_snapshot = KnowledgeSnapshot(knowledge_base, model.encode(knowledge_base))
         print("知识库嵌入完成")
 
     # 启动文件监控
@@ -181,7 +199,7 @@ async def root():
     return {
         "message": "BGE API服务运行中",
         "model_loaded": model is not None,
-        "knowledge_base_size": len(knowledge_base)
+        "knowledge_base_size": len(knowledge_snapshot.paragraphs)
     }
 
 
@@ -222,31 +240,33 @@ async def ask_question(request: QuestionRequest):
     if model is None:
         raise HTTPException(status_code=500, detail="模型未加载")
 
-    if not knowledge_base:
+    # 取当前快照的引用，之后即使知识库被重建也不影响本次查询
+    snapshot = knowledge_snapshot
+    if not snapshot.paragraphs:
         raise HTTPException(status_code=404, detail="知识库未加载")
 
-    with reload_lock:  # 确保查询时数据不会被更新
-        start_time = time.time()
-
-        question_embedding = model.encode([request.question])
-        similarities = cosine_similarity(question_embedding, knowledge_embeddings)[0]
-        top_indices = np.argsort(similarities)[::-1][:request.top_k]
+    start_time = time.time()
 
-        relevant_passages = []
-        for i, idx in enumerate(top_indices):
-            relevant_passages.append({
-                "rank": i + 1,
-                "similarity": float(similarities[idx]),
-                "content": knowledge_base[idx]
-            })
+    question_embedding = model.encode([request.question])[0]
+    question_embedding = question_embedding / max(np.linalg.norm(question_embedding), 1e-12)
+    similarities = snapshot.normalized @ question_embedding
+    top_indices = np.argsort(similarities)[::-1][:request.top_k]
+
+    relevant_passages = []
+    for i, idx in enumerate(top_indices):
+        relevant_passages.append({
+            "rank": i + 1,
+            "similarity": float(similarities[idx]),
+            "content": snapshot.paragraphs[idx]
+        })
 
-        processing_time = time.time() - start_time
+    processing_time = time.time() - start_time
 
-        return AnswerResponse(
-            question=request.question,
-            relevant_passages=relevant_passages,
-            processing_time=processing_time
-        )
+    return AnswerResponse(
+        question=request.question,
+        relevant_passages=relevant_passages,
+        processing_time=processing_time
+    )
 
 
 @app.post("/v1/embeddings")
@@ -292,7 +312,7 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": model is not None,
-        "knowledge_base_loaded": len(knowledge_base) > 0
+        "knowledge_base_loaded": len(knowledge_snapshot.paragraphs) > 0
     }
 
 
@@ -3238,9 +3238,27 @@ class set_pyqt(QWidget):
             sock.close()
 
             if result == 0:
-                # 服务正在运行
-                getattr(self.ui, status_label).setText(f"状态：{service_name.upper()}服务正在运行")
-                self.update_status_indicator(service_name, True)
+                # 端口已打开，再问 /ready 模型是否加载并预热完成；没有 /ready 的服务（如TTS）按端口判断
+                load_error = None
+                try:
+                    response = requests.get(f"http://localhost:{port}/ready", timeout=1)
+                    ready = response.status_code != 503
+                except requests.RequestException:
+                    ready = True
+                if not ready:
+                    # 503 一律算未就绪，正文不是 JSON（比如代理返回的错误页）时只是拿不到错误信息
+                    try:
+                        load_error = response.json().get("error")
+                    except (ValueError, AttributeError):
+                        pass
+
+                if ready:
+                    getattr(self.ui, status_label).setText(f"状态：{service_name.upper()}服务正在运行")
+                elif load_error:
+                    getattr(self.ui, status_label).setText(f"状态：{service_name.upper()}服务模型加载失败")
+                else:
+                    getattr(self.ui, status_label).setText(f"状态：{service_name.upper()}服务正在加载模型")
+                self.update_status_indicator(service_name, ready)
             else:
                 # 服务未运行
                 getattr(self.ui, status_label).setText(f"状态：{service_name.upper()}服务未启动")